@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'drf_yasg',
@@ -55,6 +56,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'market_app.metrics.MetricsMiddleware',
+    'market_app.querybudget.QueryBudgetMiddleware',
+    'market_app.replicas.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -67,6 +71,35 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'config.urls'
 
+# Бюджет запросов к базе на эндпоинт (market_app.querybudget):
+# при DEBUG превышение пишется в лог, в тестах роняет тест
+QUERY_BUDGET_RAISE = False
+QUERY_BUDGET_DEFAULT = 10
+QUERY_BUDGETS = {
+    # Бюджеты эндпоинтов с обязательной авторизацией включают запрос роли
+    # при промахе кэша Principal; публичные списки считаются без него
+    'AdvertisementViewSet.list': 3,
+    'AdvertisementViewSet.retrieve': 4,
+    'AdvertisementViewSet.suggest': 1,
+    'AdvertisementViewSet.facets': 2,
+    'AdvertisementViewSet.reviews': 3,
+    'AdvertisementViewSet.create': 4,
+    'AdvertisementViewSet.update': 6,
+    # Замена изображения: учёт ссылок на старый и новый файлы
+    'AdvertisementViewSet.partial_update': 10,
+    'AdvertisementViewSet.destroy': 7,
+    'AdvertisementViewSet.bulk': 10,
+    'AdsListAPIView.get': 4,
+    'ReviewViewSet.list': 2,
+    'ReviewViewSet.retrieve': 4,
+    'ReviewViewSet.create': 4,
+    'ReviewViewSet.destroy': 4,
+    'AsyncAdvertisementView.get': 4,
+    'AsyncReviewView.get': 3,
+}
+
+TEST_RUNNER = 'market_app.testing.QueryBudgetTestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -100,6 +133,88 @@ DATABASES = {
     }
 }
 
+# Реплика для чтения (market_app.replicas). Маршрутизация включается
+# переменной DB_REPLICA_HOST; в тестах алиас — зеркало default
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'HOST': os.getenv('DB_REPLICA_HOST', os.getenv('DB_HOST')),
+    'PORT': os.getenv('DB_REPLICA_PORT', os.getenv('DB_PORT')),
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['market_app.replicas.ReplicaRouter']
+
+REPLICA_DATABASE = 'replica' if os.getenv('DB_REPLICA_HOST') else None
+REPLICA_READ_ENDPOINTS = {
+    'AdvertisementViewSet.list',
+    'AdvertisementViewSet.retrieve',
+    'AdvertisementViewSet.suggest',
+    'AdvertisementViewSet.facets',
+    'AdvertisementViewSet.reviews',
+    'AdsListAPIView.get',
+    'ReviewViewSet.list',
+    'ReviewViewSet.retrieve',
+    'AsyncAdvertisementView.get',
+    'AsyncReviewView.get',
+}
+# После записи клиент столько секунд читает из основной базы: срок
+# должен быть больше обычного отставания реплики
+REPLICA_STICKY_COOKIE = 'read_primary_until'
+REPLICA_STICKY_SECONDS = 10
+# Пауза перед повторной попыткой подключиться к недоступной реплике
+REPLICA_RETRY_SECONDS = 30
+
+# Адреса, с которых доступен /metrics (сборщик Prometheus), через запятую;
+# за обратным прокси REMOTE_ADDR — адрес прокси. Остальным /metrics
+# доступен только после входа администратором
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'market',
+    },
+    # Отдельный кэш подсказок, чтобы частые запросы с клавиатуры
+    # не вытесняли остальные записи; размер ограничен MAX_ENTRIES
+    'suggest': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'suggest',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+# Общий для всех процессов кэш. Без REDIS_URL его роль играет память
+# процесса, и сброс кэша ответов работает только при одном процессе
+# (runserver или один воркер uvicorn/gunicorn)
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+# Кэш ответов list/retrieve объявлений и отзывов (market_app.cache).
+# Ответы лежат в кэше процесса, а поколение, которое входит в их ключ
+# и ETag и сдвигается при записи, — в общем кэше
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+GENERATION_CACHE_ALIAS = 'shared' if REDIS_URL else 'default'
+
+# Кэш роли и активности пользователей для PrincipalJWTAuthentication.
+# Он общий, чтобы сброс сигналом после изменения пользователя дошёл до
+# всех воркеров; без REDIS_URL запись в других процессах устаревает
+# только через PRINCIPAL_CACHE_TIMEOUT, поэтому срок короткий
+PRINCIPAL_CACHE_ALIAS = 'shared' if REDIS_URL else 'default'
+PRINCIPAL_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -176,17 +291,40 @@ AUTH_USER_MODEL = 'users_app.User'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+# Загрузки хранятся по хэшу содержимого без дублей (market_app.storage)
+STORAGES = {
+    'default': {
+        'BACKEND': 'market_app.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Обработка загруженных изображений (market_app.images): ширины
+# уменьшенных копий и число фоновых потоков (0 — сразу после коммита)
+IMAGE_VARIANT_WIDTHS = (160, 320, 640)
+IMAGE_WORKERS = 2
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': [
+        'market_app.renderers.FastJSONRenderer',
+        'market_app.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated'
         ]
 }
 
 DJOSER = {
-    'SERIALIZERS': {},
+    'SERIALIZERS': {
+        'user': 'users_app.serializers.UserSerializer',
+        'current_user': 'users_app.serializers.UserSerializer',
+    },
     'LOGIN_FIELD': 'email',
     'PASSWORD_RESET_CONFIRM_URL':
         '/users/reset_password_confirm/{uid}/{token}',
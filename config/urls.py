@@ -22,6 +22,7 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
 from config import settings
+from market_app.metrics import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -44,4 +45,5 @@ urlpatterns = [
          name='schema-redoc'),
     path('', include('users_app.urls', namespace='users')),
     path('market/', include('market_app.urls', namespace='market')),
+    path('metrics', metrics_view, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
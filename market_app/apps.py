@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MarketAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'market_app'
+
+    def ready(self):
+        import market_app.signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+
+        from market_app.querybudget import install_recorder
+        connection_created.connect(install_recorder)
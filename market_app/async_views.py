@@ -0,0 +1,139 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.exceptions import (APIException, NotAuthenticated,
+                                       NotFound, PermissionDenied)
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.request import Request
+from rest_framework_simplejwt.settings import api_settings
+
+from market_app.filters import (AdvertisementFilterSet,
+                                AdvertisementOrderingFilter,
+                                AdvertisementSearchFilter)
+from market_app.models import Advertisement, Review
+from market_app.paginators import AdvertisementPaginator, ReviewPaginator
+from market_app.renderers import FastJSONRenderer
+from market_app.serializers import AdvertisementSerializer, ReviewSerializer
+from users_app.authentication import (PrincipalJWTAuthentication,
+                                      aget_principal, check_principal,
+                                      get_token_user_id)
+
+
+async def aauthenticate(request):
+    """
+    JWT-аутентификация для асинхронных представлений: токен проверяется
+    в памяти, а Principal берётся из кэша (при промахе — через afirst()).
+    """
+    authentication = PrincipalJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return AnonymousUser()
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return AnonymousUser()
+
+    token = authentication.get_validated_token(raw_token)
+    if api_settings.CHECK_REVOKE_TOKEN:
+        return await sync_to_async(authentication.get_user)(token)
+    return check_principal(await aget_principal(get_token_user_id(token)))
+
+
+class AsyncReadOnlyView(View):
+    """
+    Асинхронные list и retrieve поверх асинхронного ORM: страница
+    выбирается через acount() и асинхронную итерацию, объект — через
+    aget(). Пагинаторы, сериализаторы, фильтры и права доступа те же,
+    что у синхронных ViewSet, поэтому ответы совпадают.
+    """
+    queryset = None
+    serializer_class = None
+    pagination_class = None
+    filter_backends = []
+    permission_classes_by_action = {'list': [AllowAny]}
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, pk=None):
+        self.action = 'list' if pk is None else 'retrieve'
+        request = Request(request, authenticators=())
+        self.request = request
+        try:
+            request.user = await aauthenticate(request._request)
+            self.check_permissions(request)
+            if pk is None:
+                data = await self.list(request)
+            else:
+                data = await self.retrieve(request, pk)
+        except APIException as exc:
+            return self.handle_exception(exc)
+        return self.render(data)
+
+    def get_permissions(self):
+        return [permission() for permission in
+                self.permission_classes_by_action.get(self.action,
+                                                      [IsAuthenticated])
+                ]
+
+    def check_permissions(self, request):
+        for permission in self.get_permissions():
+            if not permission.has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise NotAuthenticated()
+                raise PermissionDenied(getattr(permission, 'message', None))
+
+    def get_queryset(self):
+        queryset = self.serializer_class.sparse_queryset(
+            self.queryset.all(), self.request)
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        return self.serializer_class(
+            *args, context={'request': self.request, 'view': self}, **kwargs)
+
+    async def list(self, request):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(self.get_queryset(),
+                                                  request, self)
+        data = self.get_serializer(page, many=True).data
+        return paginator.get_paginated_response(data).data
+
+    async def retrieve(self, request, pk):
+        try:
+            instance = await self.serializer_class.sparse_queryset(
+                self.queryset, request).aget(pk=pk)
+        except self.queryset.model.DoesNotExist:
+            raise NotFound()
+        return self.get_serializer(instance).data
+
+    def render(self, data, status=200):
+        return HttpResponse(FastJSONRenderer().render(data), status=status,
+                            content_type='application/json')
+
+    def handle_exception(self, exc):
+        data = exc.detail
+        if not isinstance(data, (list, dict)):
+            data = {'detail': data}
+        response = self.render(data, exc.status_code)
+        if exc.status_code == 401:
+            response['WWW-Authenticate'] = (
+                PrincipalJWTAuthentication().authenticate_header(
+                    self.request))
+        return response
+
+
+class AsyncAdvertisementView(AsyncReadOnlyView):
+    queryset = Advertisement.objects.with_reviews()
+    serializer_class = AdvertisementSerializer
+    pagination_class = AdvertisementPaginator
+    filter_backends = [DjangoFilterBackend, AdvertisementSearchFilter,
+                       AdvertisementOrderingFilter]
+    filterset_class = AdvertisementFilterSet
+
+
+class AsyncReviewView(AsyncReadOnlyView):
+    queryset = Review.objects.all()
+    serializer_class = ReviewSerializer
+    pagination_class = ReviewPaginator
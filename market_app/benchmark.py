@@ -0,0 +1,284 @@
+import json
+import math
+import platform
+import random
+import threading
+import time
+from contextlib import nullcontext
+from itertools import cycle, islice
+
+import requests
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from market_app.models import Advertisement
+from market_app.querybudget import record_queries
+from users_app.models import User
+
+
+BENCH_EMAIL = 'bench@bench.example'
+BENCH_PASSWORD = 'bench-password'
+SEARCH_TERMS = ('велосипед', 'новый диван', 'ноутбук', 'б/у телефон',
+                'детская коляска', 'торг', 'test')
+
+
+class Scenario:
+    """
+    Сценарий нагрузки: метод, набор адресов (перебираются по кругу),
+    тело запроса и нужна ли авторизация.
+    """
+
+    def __init__(self, name, paths, method='get', data=None, auth=False):
+        self.name = name
+        self.paths = paths
+        self.method = method
+        self.data = data
+        self.auth = auth
+
+
+def get_bench_user():
+    """
+    Пользователь с известным паролем для сценариев с JWT.
+    """
+    user, created = User.objects.get_or_create(
+        email=BENCH_EMAIL,
+        defaults={'first_name': 'Bench', 'last_name': 'Bench'})
+    if created or not user.check_password(BENCH_PASSWORD):
+        user.set_password(BENCH_PASSWORD)
+        user.save(update_fields=['password'])
+    return user
+
+
+def build_scenarios(rng, pages=5, detail_ids=50):
+    """
+    Сценарии по главным маршрутам. Адреса выбираются генератором rng,
+    поэтому при одном seed прогоны повторяют одни и те же запросы.
+    """
+    refresh = RefreshToken.for_user(get_bench_user())
+    ids = list(Advertisement.objects.order_by('pk').values_list(
+        'pk', flat=True)[:detail_ids * 20])
+    ids = rng.sample(ids, min(detail_ids, len(ids)))
+    ads_list = reverse('market_app:ads-list')
+
+    scenarios = [
+        Scenario('ads-list', [f'{ads_list}?page={page}'
+                              for page in range(1, pages + 1)]),
+        Scenario('ads-list-cursor', [f'{ads_list}?pagination=cursor']),
+        Scenario('ads-search', [f'{ads_list}?search={term}'
+                                for term in SEARCH_TERMS]),
+        Scenario('reviews-list', [f"{reverse('market_app:reviews-list')}"
+                                  f'?page={page}'
+                                  for page in range(1, pages + 1)]),
+        Scenario('my-ads', [reverse('market_app:my_ads')], auth=True),
+        Scenario('jwt-create', [reverse('users:jwt-create')], method='post',
+                 data={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}),
+        Scenario('jwt-refresh', [reverse('users:jwt-refresh')],
+                 method='post', data={'refresh': str(refresh)}),
+    ]
+    if ids:
+        scenarios.insert(3, Scenario(
+            'ads-detail',
+            [reverse('market_app:ads-detail', kwargs={'pk': pk})
+             for pk in ids],
+            auth=True))
+    return scenarios, str(refresh.access_token)
+
+
+class InProcessTransport:
+    """
+    Запросы через тестовый клиент Django в том же процессе. Число
+    запросов к базе берётся из заголовка QueryBudgetMiddleware.
+    """
+
+    def __init__(self, token):
+        self.local = threading.local()
+        self.token = token
+
+    def request(self, scenario, path):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST='localhost')
+        headers = {}
+        if scenario.auth:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {self.token}'
+        if scenario.method == 'post':
+            response = client.post(path, data=scenario.data,
+                                   content_type='application/json',
+                                   **headers)
+        else:
+            response = client.get(path, **headers)
+        return response.status_code, response.headers.get('X-Query-Count')
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpTransport:
+    """
+    Запросы к запущенному серверу по HTTP. Число запросов к базе
+    сервер отдаёт только при DEBUG.
+    """
+
+    def __init__(self, base_url, token):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.local = threading.local()
+
+    def request(self, scenario, path):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        headers = {}
+        if scenario.auth:
+            headers['Authorization'] = f'Bearer {self.token}'
+        response = session.request(scenario.method.upper(),
+                                   self.base_url + path,
+                                   json=scenario.data, headers=headers)
+        return response.status_code, response.headers.get('X-Query-Count')
+
+    def close(self):
+        pass
+
+
+def percentile(values, fraction):
+    # Ближайший ранг по отсортированному списку
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1,
+                       math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def round_ms(value):
+    return round(value, 2) if value is not None else None
+
+
+def run_scenario(transport, scenario, total, concurrency, warmup):
+    """
+    Выполняет total запросов сценария в concurrency потоков
+    и возвращает сводку: пропускная способность, перцентили задержки
+    в миллисекундах и число запросов к базе.
+    """
+    paths = list(islice(cycle(scenario.paths), warmup + total))
+    for path in paths[:warmup]:
+        transport.request(scenario, path)
+
+    pending = iter(paths[warmup:])
+    lock = threading.Lock()
+    latencies, queries, errors = [], [], [0]
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    path = next(pending, None)
+                if path is None:
+                    return
+                started = time.perf_counter()
+                status, query_count = transport.request(scenario, path)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed * 1000)
+                    if status >= 400:
+                        errors[0] += 1
+                    if query_count is not None:
+                        queries.append(int(query_count))
+        finally:
+            transport.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / wall, 1) if wall else None,
+        'mean_ms': (round(sum(latencies) / len(latencies), 2)
+                    if latencies else None),
+        'p50_ms': round_ms(percentile(latencies, 0.50)),
+        'p95_ms': round_ms(percentile(latencies, 0.95)),
+        'p99_ms': round_ms(percentile(latencies, 0.99)),
+        'queries_mean': (round(sum(queries) / len(queries), 2)
+                         if queries else None),
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def run_benchmark(base_url=None, total=200, concurrency=4, warmup=10,
+                  seed=0, only=None, cold=False):
+    """
+    Прогон всех сценариев (или только перечисленных в only) в процессе
+    либо против сервера base_url. При cold в процессе отключается кэш
+    ответов, чтобы измерять сериализацию и запросы, а не кэш.
+    Результат сериализуется в JSON.
+    """
+    scenarios, token = build_scenarios(random.Random(seed))
+    if base_url:
+        transport = HttpTransport(base_url, token)
+    else:
+        transport = InProcessTransport(token)
+    cache_settings = (override_settings(RESPONSE_CACHE_TIMEOUT=0)
+                      if cold and not base_url else nullcontext())
+
+    results = {}
+    # record_queries включает заголовок X-Query-Count и без DEBUG
+    with record_queries(), cache_settings:
+        for scenario in scenarios:
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = run_scenario(
+                transport, scenario, total, concurrency, warmup)
+    return {
+        'meta': {'mode': 'http' if base_url else 'in-process',
+                 'base_url': base_url,
+                 'requests': total,
+                 'concurrency': concurrency,
+                 'warmup': warmup,
+                 'seed': seed,
+                 'cold': cold,
+                 'ads': Advertisement.objects.count(),
+                 'python': platform.python_version(),
+                 'started_at': timezone.now().isoformat()},
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Регрессии относительно baseline: рост p50/p95 больше чем на
+    tolerance (доля) и рост максимального числа запросов к базе.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if current[metric] is None or previous.get(metric) is None:
+                continue
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: {metric} {previous[metric]} -> '
+                    f'{current[metric]}')
+        if (current['queries_max'] is not None
+                and previous.get('queries_max') is not None
+                and current['queries_max'] > previous['queries_max']):
+            regressions.append(
+                f"{name}: queries_max {previous['queries_max']} -> "
+                f"{current['queries_max']}")
+    return regressions
+
+
+def dump(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
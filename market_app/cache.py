@@ -0,0 +1,186 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from market_app.metrics import observe_cache
+from market_app.replicas import is_sticky, reads_from_replica
+
+
+GENERATION_KEY = 'market:generation'
+HITS_KEY = 'market:response-cache:hits'
+MISSES_KEY = 'market:response-cache:misses'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_generation_cache():
+    """
+    Кэш счётчика поколений. Он должен быть общим для всех процессов
+    (GENERATION_CACHE_ALIAS), иначе после записи остальные воркеры
+    продолжат отдавать старые ответы и 304. Сами ответы могут лежать
+    в локальном кэше процесса: поколение входит в их ключ.
+    """
+    return caches[settings.GENERATION_CACHE_ALIAS]
+
+
+def get_generation():
+    cache = get_generation_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Начальное значение уникально: если ключ вытеснят, счётчик
+        # не вернётся к поколению, под которым ещё лежат старые ответы
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    cache = get_generation_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate_responses():
+    """
+    Делает недействительными все закэшированные ответы. Поколение
+    сдвигается сразу и ещё раз после коммита, чтобы ответ, собранный
+    параллельным запросом до коммита, не остался в кэше.
+    """
+    bump_generation()
+    transaction.on_commit(bump_generation)
+
+
+def _increment(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_stats():
+    values = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': values.get(HITS_KEY, 0),
+            'misses': values.get(MISSES_KEY, 0)}
+
+
+def get_request_url(request):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    return f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+
+
+class ConditionalGetMixin:
+    """
+    Добавляет ETag к ответам list и retrieve (и Last-Modified к retrieve)
+    и отвечает 304 на If-None-Match / If-Modified-Since, не загружая
+    и не сериализуя данные. Версия объекта — его updated_at, версия
+    списка — поколение кэша ответов, которое сдвигается при любом
+    изменении объявлений и отзывов.
+    """
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag(request, f'generation:{get_generation()}')
+        return self.conditional_response(super().list, request, etag, None,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            updated_at = self.get_queryset().prefetch_related(None).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            updated_at = None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = self.get_etag(
+            request, f'{kwargs[lookup_url_kwarg]}:{updated_at.isoformat()}')
+        return self.conditional_response(super().retrieve, request, etag,
+                                         int(updated_at.timestamp()),
+                                         *args, **kwargs)
+
+    def get_etag(self, request, version):
+        # Формат ответа и параметры запроса меняют тело ответа,
+        # поэтому входят в сильный ETag вместе с версией данных
+        value = '|'.join((version, request.accepted_renderer.format,
+                          get_request_url(request)))
+        return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+    def conditional_response(self, handler, request, etag, last_modified,
+                             *args, **kwargs):
+        not_modified = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ResponseCacheMixin:
+    """
+    Кэширует ответы list и retrieve. Ключ включает адрес запроса
+    с отсортированными параметрами (в том числе страницу) и текущее
+    поколение, которое сдвигают сигналы при изменении объявлений
+    и отзывов. Клиент, который недавно что-то изменил, читает мимо
+    кэша, а ответы, прочитанные из реплики, не сохраняются: реплика
+    может отставать и отдать данные прошлого поколения.
+    """
+    response_cache_timeout = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request,
+                                    *args, **kwargs)
+
+    def get_response_cache_key(self, request):
+        url = get_request_url(request)
+        return 'market:response:{}:{}:{}:{}'.format(
+            get_generation(), self.basename, self.action,
+            hashlib.md5(url.encode()).hexdigest()
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if is_sticky(request):
+            response = handler(request, *args, **kwargs)
+            response['X-Cache'] = 'BYPASS'
+            return response
+
+        cache = get_cache()
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        observe_cache('response', data is not None)
+        if data is not None:
+            _increment(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _increment(MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and not reads_from_replica():
+            timeout = self.response_cache_timeout
+            if timeout is None:
+                timeout = settings.RESPONSE_CACHE_TIMEOUT
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
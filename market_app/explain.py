@@ -0,0 +1,164 @@
+import json
+import re
+
+from django.db import connection, transaction
+
+
+# Колонки в условиях равенства: "(author_id = 1)",
+# "(market_app_review.ad_id = ANY (...))"
+EQUALITY = re.compile(r'\(?(?:\w+\.)?(\w+) = ')
+# Ключ сортировки по колонке: "market_app_advertisement.created_at DESC"
+SORT_KEY = re.compile(r'^(?:\w+\.)?(\w+)( DESC)?$')
+SCAN_CONDITIONS = ('Index Cond', 'Recheck Cond', 'Filter')
+
+
+def explain(sql, params):
+    """
+    План выполнения запроса с EXPLAIN (ANALYZE, BUFFERS). Запрос
+    выполняется, поэтому анализируются только SELECT, а транзакция
+    откатывается.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+        transaction.set_rollback(True)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def walk(node, parents=()):
+    yield node, parents
+    for child in node.get('Plans', []):
+        yield from walk(child, parents + (node,))
+
+
+def first_scan(node):
+    for child, _ in walk(node):
+        if 'Relation Name' in child:
+            return child
+    return None
+
+
+def equality_columns(scan):
+    columns = []
+    for key in SCAN_CONDITIONS:
+        for column in EQUALITY.findall(scan.get(key, '')):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def sort_columns(sort):
+    columns = []
+    for key in sort.get('Sort Key', []):
+        match = SORT_KEY.match(key.strip())
+        if match is None:
+            # Сортировка по выражению (например, рангу поиска)
+            # индексом по колонкам не заменяется
+            return None
+        columns.append(match.group(1) + (match.group(2) or ''))
+    return columns
+
+
+def table_indexes(table):
+    """
+    Индексы таблицы: {имя: (колонки с направлением, уникальный ли)}.
+    """
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    indexes = {}
+    for name, item in constraints.items():
+        if not (item['index'] or item['primary_key'] or item['unique']):
+            continue
+        orders = item.get('orders') or []
+        columns = [
+            column + (' DESC' if index < len(orders)
+                      and orders[index] == 'DESC' else '')
+            for index, column in enumerate(item['columns'])
+        ]
+        indexes[name] = (columns, item['unique'] or item['primary_key'])
+    return indexes
+
+
+def suggest_index(table, equality, order):
+    """
+    CREATE INDEX на колонки равенства и сортировки, если ни один
+    существующий индекс таблицы не начинается с них же (направление
+    не учитывается: индекс читается и в обратном порядке). Выборка
+    по уникальному ключу индекса не требует.
+    """
+    columns = equality + [column for column in order
+                          if column.split()[0] not in equality]
+    names = [column.split()[0] for column in columns]
+    if not names:
+        return None
+    for index, unique in table_indexes(table).values():
+        index = [column.split()[0] for column in index]
+        if index[:len(names)] == names or (
+                unique and set(index) <= set(equality)):
+            return None
+    return f'CREATE INDEX ON {table} ({", ".join(columns)});'
+
+
+def analyze_plan(plan, min_rows=1000, max_cost=1000):
+    """
+    Замечания по плану: последовательные сканирования больших таблиц,
+    сканирования индекса с отбрасыванием строк фильтром, сортировки без
+    индекса и дорогие узлы. Возвращает (замечания, предложенные индексы).
+    """
+    notes, suggestions = [], []
+
+    def suggest(table, equality, order):
+        index = suggest_index(table, equality, order or [])
+        if index is not None and index not in suggestions:
+            suggestions.append(index)
+
+    for node, parents in walk(plan['Plan']):
+        node_type = node['Node Type']
+        removed = node.get('Rows Removed by Filter', 0)
+        rows = (node.get('Actual Rows', 0) * node.get('Actual Loops', 1)
+                + removed)
+        sort = next((parent for parent in reversed(parents)
+                     if parent['Node Type'] == 'Sort'), None)
+
+        if node_type == 'Seq Scan' and rows >= min_rows:
+            table = node['Relation Name']
+            notes.append(f'Seq Scan on {table}: {rows} rows read, '
+                         f"filter {node.get('Filter', '-')}")
+            suggest(table, equality_columns(node),
+                    sort_columns(sort) if sort is not None else [])
+
+        elif (node_type == 'Index Scan' and 'Filter' in node
+              and (removed >= min_rows or node['Total Cost'] > max_cost)):
+            # Индекс задаёт порядок, а условие проверяется по строкам:
+            # нужен индекс, начинающийся с колонок условия
+            table = node['Relation Name']
+            notes.append(f"Index Scan on {node['Index Name']} filters "
+                         f"{node['Filter']}: {removed} rows removed")
+            order = table_indexes(table).get(node['Index Name'], ([],))[0]
+            suggest(table, EQUALITY.findall(node['Filter']), order)
+
+        elif node_type in ('Sort', 'Incremental Sort'):
+            notes.append(f"{node_type} on {', '.join(node['Sort Key'])} "
+                         f"({node.get('Sort Method', '?')})")
+            scan = first_scan(node)
+            keys = sort_columns(node)
+            if keys and scan is not None:
+                suggest(scan['Relation Name'], equality_columns(scan), keys)
+
+        children = node.get('Plans', [])
+        if (node['Total Cost'] > max_cost
+                and all(child['Total Cost'] <= max_cost
+                        for child in children)):
+            notes.append(f"High cost {node_type} "
+                         f"({node['Total Cost']:.0f})")
+
+    return notes, suggestions
+
+
+def buffers(plan):
+    node = plan['Plan']
+    return {'hit': node.get('Shared Hit Blocks', 0),
+            'read': node.get('Shared Read Blocks', 0)}
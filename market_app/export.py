@@ -0,0 +1,126 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+
+from market_app.models import Advertisement, Review
+
+
+# Число строк, которое серверный курсор получает из базы за раз
+CHUNK_SIZE = 2000
+
+ADVERTISEMENT_FIELDS = ('id', 'title', 'price', 'description', 'author',
+                        'image', 'created_at', 'updated_at', 'review_count',
+                        'last_reviewed_at')
+REVIEW_FIELDS = ('id', 'ad', 'author', 'text', 'created_at', 'updated_at')
+
+EXPORTS = {'ads': (Advertisement, ADVERTISEMENT_FIELDS),
+           'reviews': (Review, REVIEW_FIELDS)}
+
+
+class _Echo:
+    """
+    Псевдофайл для csv.writer: writerow возвращает строку, а не пишет её.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _ndjson_lines(rows, fields, header=True):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder,
+                         ensure_ascii=False) + '\n'
+
+
+def _csv_lines(rows, fields, header=True):
+    writer = csv.writer(_Echo())
+    if header:
+        yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in row
+        )
+
+
+FORMATS = {'ndjson': (_ndjson_lines, 'application/x-ndjson'),
+           'csv': (_csv_lines, 'text/csv')}
+
+
+def export_rows(queryset, fields, chunk_size=CHUNK_SIZE):
+    """
+    Строки выгрузки в порядке первичного ключа. iterator() читает их
+    серверным курсором PostgreSQL порциями по chunk_size, так что память
+    не зависит от размера таблицы.
+    """
+    return queryset.order_by('pk').values_list(*fields).iterator(
+        chunk_size=chunk_size)
+
+
+def export_lines(queryset, fields, export_format, chunk_size=CHUNK_SIZE):
+    """
+    Выгрузка в формате export_format ('ndjson' или 'csv'). Строки
+    склеиваются в блоки по chunk_size, чтобы не отдавать их по одной.
+    """
+    render = FORMATS[export_format][0]
+    block = []
+    for line in render(export_rows(queryset, fields, chunk_size), fields):
+        block.append(line)
+        if len(block) >= chunk_size:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+async def aexport_lines(queryset, fields, export_format,
+                        chunk_size=CHUNK_SIZE):
+    """
+    Асинхронный вариант export_lines для ASGI: синхронный итератор
+    StreamingHttpResponse Django собрал бы в список целиком до отправки.
+    Каждая порция серверного курсора читается в потоке sync_to_async
+    (aiterator() в Django 4.2 выполняет запрос values_list() прямо
+    в цикле событий).
+    """
+    render = FORMATS[export_format][0]
+    rows = export_rows(queryset, fields, chunk_size)
+    read_block = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    header = True
+    while True:
+        block = await read_block()
+        if block or header:
+            yield ''.join(render(block, fields, header))
+        if len(block) < chunk_size:
+            return
+        header = False
+
+
+class ExportMixin:
+    """
+    Потоковая выгрузка всех записей: <ресурс>/export/ndjson/
+    и <ресурс>/export/csv/. Под ASGI ответ строится из асинхронного
+    итератора, под WSGI — из обычного.
+    """
+    export_fields = ()
+    export_chunk_size = CHUNK_SIZE
+
+    @action(detail=False, methods=['get'],
+            url_path=r'export/(?P<export_format>ndjson|csv)')
+    def export(self, request, export_format):
+        queryset = self.get_queryset().prefetch_related(None)
+        lines = (aexport_lines if isinstance(request._request, ASGIRequest)
+                 else export_lines)
+        response = StreamingHttpResponse(
+            lines(queryset, self.export_fields, export_format,
+                  self.export_chunk_size),
+            content_type=f'{FORMATS[export_format][1]}; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.basename}.{export_format}"')
+        return response
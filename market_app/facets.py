@@ -0,0 +1,93 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from market_app.cache import get_cache, get_generation
+from market_app.metrics import observe_cache
+
+
+# Диапазоны цены [от, до); None — без границы
+PRICE_BUCKETS = ((None, 1000), (1000, 5000), (5000, 20000),
+                 (20000, 100000), (100000, None))
+# Возраст объявления: создано не раньше, чем столько назад
+AGE_BUCKETS = (('day', timedelta(days=1)), ('week', timedelta(days=7)),
+               ('month', timedelta(days=30)), ('year', timedelta(days=365)))
+
+
+def price_condition(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def facet_counts(queryset, now=None):
+    """
+    Общее число и счётчики по диапазонам цены и возрасту одним
+    агрегирующим запросом: Count с условием на каждый диапазон.
+    """
+    now = now or timezone.now()
+    aggregates = {'total': Count('pk')}
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{index}'] = Count(
+            'pk', filter=price_condition(low, high))
+    for key, age in AGE_BUCKETS:
+        aggregates[f'age_{key}'] = Count(
+            'pk', filter=Q(created_at__gte=now - age))
+    counts = queryset.order_by().aggregate(**aggregates)
+
+    return {
+        'total': counts['total'],
+        'price': [{'min': low, 'max': high, 'count': counts[f'price_{index}']}
+                  for index, (low, high) in enumerate(PRICE_BUCKETS)],
+        'created_at': [{'key': key, 'count': counts[f'age_{key}']}
+                       for key, _ in AGE_BUCKETS],
+    }
+
+
+class FacetsMixin:
+    """
+    Счётчики для боковой панели поиска: <ресурс>/facets/ с теми же
+    фильтрами и поиском, что у списка. Ответ кэшируется по нормализованному
+    набору фильтров: порядок параметров, страница и сортировка на ключ
+    не влияют.
+    """
+    facets_search_filter = None
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        queryset = self.get_queryset().prefetch_related(None)
+        filterset = DjangoFilterBackend().get_filterset(request, queryset,
+                                                        self)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+
+        search_filter = self.facets_search_filter()
+        terms = [term.lower()
+                 for term in search_filter.get_search_terms(request)]
+        params = sorted((name, str(value))
+                        for name, value in filterset.form.cleaned_data.items()
+                        if value is not None)
+        key = 'market:facets:{}:{}:{}'.format(
+            get_generation(), self.basename, hashlib.md5(
+                json.dumps([params, terms]).encode()).hexdigest())
+
+        cache = get_cache()
+        data = cache.get(key)
+        observe_cache('facets', data is not None)
+        if data is None:
+            # Только условие поиска: ранг для подсчёта не нужен
+            queryset = search_filter.search(request, filterset.qs)
+            data = facet_counts(queryset)
+            cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+        return Response(data)
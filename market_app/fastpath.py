@@ -0,0 +1,181 @@
+import decimal
+from collections import defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from market_app.metrics import observe_serializer
+from market_app.models import LATEST_REVIEWS, Review
+
+
+def decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string',
+                               api_settings.COERCE_DECIMAL_TO_STRING)
+    if (field.decimal_places is None or field.localize
+            or not coerce_to_string):
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return format(value.quantize(exponent, rounding=rounding,
+                                     context=context), 'f')
+    return convert
+
+
+def datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = (field.timezone if hasattr(field, 'timezone')
+                      else field.default_timezone())
+    if (output_format is None or output_format.lower() != 'iso-8601'
+            or field_timezone is None):
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def file_converter(field, model_field):
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return field.to_representation
+    storage = model_field.storage
+    request = field.context.get('request')
+    build_absolute_uri = (request.build_absolute_uri if request is not None
+                          else str)
+
+    def convert(value):
+        if not value:
+            return None
+        return build_absolute_uri(storage.url(value))
+    return convert
+
+
+def identity(value):
+    return value
+
+
+def get_converter(field, model_field):
+    """
+    Преобразование значения столбца из .values() в то же, что вернул бы
+    field.to_representation для значения атрибута модели.
+    """
+    if isinstance(field, serializers.DecimalField):
+        return decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return datetime_converter(field)
+    if isinstance(field, serializers.FileField):
+        return file_converter(field, model_field)
+    if isinstance(field, (serializers.IntegerField, serializers.CharField)):
+        return identity
+    if (isinstance(field, serializers.PrimaryKeyRelatedField)
+            and field.pk_field is None):
+        # .values() отдаёт для внешнего ключа сам id
+        return identity
+    return field.to_representation
+
+
+def latest_review_texts(ad_ids, limit=LATEST_REVIEWS):
+    """
+    Тексты limit последних отзывов каждого объявления одним запросом,
+    как в AdvertisementQuerySet.with_reviews().
+    """
+    texts = defaultdict(list)
+    rows = Review.objects.filter(ad_id__in=ad_ids).annotate(
+        position=Window(RowNumber(), partition_by=F('ad_id'),
+                        order_by=(F('created_at').desc(), F('id').desc()))
+    ).filter(position__lte=limit).order_by(
+        '-created_at', '-id').values_list('ad_id', 'text')
+    for ad_id, text in rows:
+        texts[ad_id].append(text)
+    return texts
+
+
+class AdvertisementRows:
+    """
+    Быстрое представление объявлений для чтения: строки выбираются через
+    .values(), а поля сериализатора заменяются заранее подготовленными
+    преобразователями. Результат совпадает с AdvertisementSerializer.
+    Для полей, которые нельзя взять из столбца, supported == False.
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.model = serializer.Meta.model
+        self.fields = []
+        self.with_reviews = False
+        self.supported = True
+        # Позиция курсора и порядок страницы
+        self.columns = {'id', 'created_at'}
+
+        for name, field in serializer.fields.items():
+            if name == 'review':
+                self.with_reviews = True
+                self.fields.append((name, None, None))
+                continue
+            try:
+                model_field = self.model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                self.supported = False
+                return
+            if not model_field.concrete:
+                self.supported = False
+                return
+            self.columns.add(field.source)
+            self.fields.append((name, field.source,
+                                get_converter(field, model_field)))
+
+    def values(self, queryset):
+        return queryset.prefetch_related(None).values(*self.columns)
+
+    def represent(self, rows):
+        with observe_serializer(type(self.serializer).__name__):
+            texts = {}
+            if self.with_reviews:
+                texts = latest_review_texts([row['id'] for row in rows])
+            no_reviews = self.serializer.NO_REVIEWS
+            fields = self.fields
+            data = []
+            for row in rows:
+                item = {}
+                for name, column, convert in fields:
+                    if column is None:
+                        item[name] = texts.get(row['id']) or no_reviews
+                        continue
+                    value = row[column]
+                    item[name] = None if value is None else convert(value)
+                data.append(item)
+            return data
+
+
+class FastListMixin:
+    """
+    list() без экземпляров моделей и сериализатора на каждую строку
+    (AdvertisementRows). Фильтры, поиск, сортировка, пагинация
+    и ?fields= работают как обычно; если поле нельзя вывести быстро,
+    используется стандартный list().
+    """
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        rows = AdvertisementRows(self.get_serializer())
+        if not self.fast_list or not rows.supported:
+            return super().list(request, *args, **kwargs)
+
+        queryset = rows.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.represent(page))
+        return Response(rows.represent(list(queryset)))
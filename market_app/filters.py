@@ -0,0 +1,117 @@
+import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from market_app.models import HAS_IMAGE, Advertisement
+
+
+# Должна совпадать с конфигурацией в функции
+# market_app_advertisement_search_vector (миграция 0005)
+SEARCH_CONFIG = 'russian'
+
+# Поля ?ordering и полный ключ сортировки для каждого: он совпадает
+# с индексом (или читает его в обратном порядке) и заканчивается id,
+# поэтому порядок однозначен
+ORDERINGS = {
+    'price': ('price', 'id'),
+    'created_at': ('created_at', 'id'),
+    'review_count': ('review_count', 'created_at', 'id'),
+}
+
+
+class AdvertisementSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск по заголовку и описанию объявления.
+
+    Запрос идёт по столбцу search_vector с GIN-индексом, результаты
+    сортируются по релевантности: совпадение в заголовке весит больше,
+    чем в описании.
+    """
+    search_config = SEARCH_CONFIG
+
+    def get_search_query(self, request):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return None
+        return SearchQuery(' '.join(search_terms),
+                           config=self.search_config,
+                           search_type='websearch')
+
+    def search(self, request, queryset):
+        """
+        Только условие поиска, без ранга и сортировки.
+        """
+        query = self.get_search_query(request)
+        if query is None:
+            return queryset
+        return queryset.filter(search_vector=query)
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if query is None:
+            return queryset
+
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', *queryset.model._meta.ordering)
+
+
+class AdvertisementFilterSet(django_filters.FilterSet):
+    """
+    Фильтры списка объявлений: диапазоны цены и даты создания, автор
+    и наличие изображения. Автор и наличие изображения обслуживаются
+    индексом вместе с любой сортировкой AdvertisementOrderingFilter
+    (см. Advertisement.Meta). Диапазон цены или даты сужает индекс,
+    только если сортировка по тому же полю; при другой сортировке
+    строки отбираются при чтении индекса сортировки.
+    """
+    price_min = django_filters.NumberFilter(field_name='price',
+                                            lookup_expr='gte')
+    price_max = django_filters.NumberFilter(field_name='price',
+                                            lookup_expr='lte')
+    created_after = django_filters.IsoDateTimeFilter(
+        field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(
+        field_name='created_at', lookup_expr='lte')
+    author = django_filters.NumberFilter(field_name='author')
+    has_image = django_filters.BooleanFilter(method='filter_has_image')
+
+    class Meta:
+        model = Advertisement
+        fields = []
+
+    def filter_has_image(self, queryset, name, value):
+        if value:
+            # То же условие, что у частичных индексов
+            return queryset.filter(HAS_IMAGE)
+        return queryset.filter(Q(image__isnull=True) | Q(image=''))
+
+
+class AdvertisementOrderingFilter(OrderingFilter):
+    """
+    Сортировка ?ordering=price|created_at|review_count, с минусом — по
+    убыванию. Учитывается одно поле: для сочетаний полей индексов нет.
+    Без параметра порядок задают модель или поиск.
+    """
+    ordering_fields = list(ORDERINGS)
+    default_ordering = '-created_at'
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+
+        term = ordering[0]
+        pagination_class = getattr(view, 'pagination_class', None)
+        use_cursor = getattr(pagination_class, 'use_cursor', None)
+        if (term != self.default_ordering and use_cursor is not None
+                and use_cursor(pagination_class(), request)):
+            raise ValidationError({self.ordering_param: [
+                'Курсорная пагинация поддерживает только сортировку '
+                f'{self.default_ordering}.']})
+
+        prefix = '-' if term.startswith('-') else ''
+        return queryset.order_by(
+            *(prefix + field for field in ORDERINGS[term.lstrip('-')]))
@@ -0,0 +1,198 @@
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from market_app.storage import upload_directory
+
+
+logger = logging.getLogger(__name__)
+
+# Форматы, в которых перекодируется оригинал (без метаданных)
+REENCODE_FORMATS = {'JPEG': {'quality': 85, 'optimize': True},
+                    'PNG': {'optimize': True},
+                    'WEBP': {'quality': 80, 'method': 6}}
+# Форматы Pillow, которые сохраняются как один из REENCODE_FORMATS
+# (MPO — многокадровый JPEG камер телефонов). Остальные форматы
+# (TIFF, GIF, BMP и т. д.) перекодируются в SOURCE_FALLBACK_FORMAT
+SOURCE_FORMATS = {'MPO': 'JPEG'}
+SOURCE_FALLBACK_FORMAT = ('PNG', 'png')
+
+# Форматы вариантов: ключ в image_variants, формат Pillow, расширение
+VARIANT_FORMATS = (('jpeg', 'JPEG', 'jpg'), ('webp', 'WEBP', 'webp'))
+
+_executor = None
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if 'A' in image.getbands():
+            background.paste(image, mask=image.getchannel('A'))
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format,
+               **REENCODE_FORMATS.get(image_format, {}))
+    return buffer.getvalue()
+
+
+def render_variants(field_file):
+    """
+    Перекодирует оригинал без EXIF и прочих метаданных и сохраняет
+    уменьшенные копии в JPEG и WebP. Возвращает описание вариантов для
+    поля image_variants: {'source': имя, 'jpeg': {ширина: имя}, ...}.
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as file:
+        image = Image.open(file)
+        image_format = image.format
+        image.load()
+
+    # Поворот из EXIF применяется к пикселям, сами метаданные теряются
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              else 'RGB')
+
+    # Оригинал без метаданных сохраняется новым файлом, а старый
+    # отпускает process_image, когда запись уже ссылается на новый.
+    # Перекодируется любой формат: иначе метаданные остались бы в файле
+    source = field_file.name
+    image_format = SOURCE_FORMATS.get(image_format, image_format)
+    if image_format not in REENCODE_FORMATS:
+        image_format, extension = SOURCE_FALLBACK_FORMAT
+        source = f'{posixpath.splitext(source)[0]}.{extension}'
+    source = storage.save(source, ContentFile(_encode(image, image_format)))
+
+    # Ширина — отдельный каталог: имя файла хранилище заменит хэшем
+    directory = posixpath.join(upload_directory(source), 'variants')
+    filename = posixpath.basename(source)
+    stem = posixpath.splitext(filename)[0]
+    variants = {'source': source}
+    for key, variant_format, extension in VARIANT_FORMATS:
+        variants[key] = {}
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            variant = image.copy()
+            variant.thumbnail((width, width), Image.LANCZOS)
+            if str(variant.width) in variants[key]:
+                continue
+            name = posixpath.join(directory, f'{variant.width}w',
+                                  f'{stem}.{extension}')
+            variants[key][str(variant.width)] = storage.save(
+                name, ContentFile(_encode(variant, variant_format)))
+    return variants
+
+
+def iter_variant_names(variants):
+    for key, _, _ in VARIANT_FORMATS:
+        yield from (variants or {}).get(key, {}).values()
+
+
+def delete_variants(storage, variants):
+    for name in iter_variant_names(variants):
+        storage.delete(name)
+
+
+def process_image(model, pk, on_processed=None):
+    """
+    Строит варианты изображения записи model с первичным ключом pk,
+    если они ещё не построены для текущего файла.
+    """
+    manager = model._base_manager
+    instance = manager.filter(pk=pk).only('image', 'image_variants').first()
+    if instance is None or not needs_processing(instance):
+        return
+
+    field_file = instance.image
+    storage = field_file.storage
+    if field_file:
+        variants = render_variants(field_file)
+        queryset = manager.filter(pk=pk, image=field_file.name)
+        changes = {'image': variants['source'], 'image_variants': variants}
+    else:
+        variants = {}
+        queryset = manager.filter(Q(image__isnull=True) | Q(image=''),
+                                  pk=pk)
+        changes = {'image_variants': variants}
+
+    if queryset.update(**changes):
+        if field_file and variants['source'] != field_file.name:
+            storage.delete(field_file.name)
+        delete_variants(storage, instance.image_variants)
+        if on_processed is not None:
+            on_processed(pk)
+    else:
+        # Изображение заменили, пока шла обработка: результат устарел
+        if field_file and variants['source'] != field_file.name:
+            storage.delete(variants['source'])
+        delete_variants(storage, variants)
+
+
+def _run(model, pk, on_processed):
+    try:
+        process_image(model, pk, on_processed)
+    except Exception:
+        logger.exception('Image processing failed for %s %s',
+                         model._meta.label, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(model, pk, on_processed=None):
+    """
+    Ставит обработку изображения в фоновый пул после коммита транзакции.
+    При IMAGE_WORKERS = 0 обработка выполняется сразу после коммита
+    в текущем потоке. Пропущенные записи догоняет manage.py process_images.
+    """
+    global _executor
+
+    if not settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: process_image(model, pk, on_processed))
+        return
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                                       thread_name_prefix='images')
+    transaction.on_commit(
+        lambda: _executor.submit(_run, model, pk, on_processed))
+
+
+def needs_processing(instance):
+    variants = instance.image_variants or {}
+    if instance.image:
+        return variants.get('source') != instance.image.name
+    return bool(variants)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Варианты изображения в виде значений srcset для каждого формата:
+    {"webp": "<url> 160w, <url> 320w", "jpeg": "..."}.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        storage = self.parent.Meta.model._meta.get_field('image').storage
+        request = self.context.get('request')
+        srcset = {}
+        for key, _, _ in VARIANT_FORMATS:
+            items = []
+            for width, name in sorted(value.get(key, {}).items(),
+                                      key=lambda item: int(item[0])):
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                items.append(f'{url} {width}w')
+            srcset[key] = ', '.join(items)
+        return srcset
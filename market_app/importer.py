@@ -0,0 +1,200 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from market_app.cache import invalidate_responses
+from market_app.models import Advertisement, Review
+
+
+# Число строк, которое проверяется и загружается одним COPY
+CHUNK_SIZE = 5000
+
+ADVERTISEMENT_COLUMNS = ('id', 'title', 'price', 'description', 'author_id',
+                         'created_at', 'updated_at', 'image_variants',
+                         'review_count')
+REVIEW_COLUMNS = ('id', 'ad_id', 'author_id', 'text', 'created_at',
+                  'updated_at')
+
+
+def read_records(path, file_format):
+    """
+    Записи файла CSV или NDJSON вместе с номером строки. Строка NDJSON,
+    которую не удалось разобрать, возвращается как None.
+    """
+    with open(path, encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+            return
+
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record
+
+
+def _copy_value(value):
+    # Текстовый формат COPY: NULL — \N, спецсимволы экранируются
+    if value is None:
+        return r'\N'
+    if isinstance(value, dict):
+        value = json.dumps(value)
+    elif hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_rows(model, columns, rows):
+    """
+    Загружает строки в таблицу модели одной командой COPY FROM STDIN.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(map(_copy_value, row)) + '\n')
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    sql = 'COPY {} ({}) FROM STDIN'.format(
+        quote_name(model._meta.db_table),
+        ', '.join(map(quote_name, columns)))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+
+
+def allocate_ids(model, count):
+    """
+    Резервирует count первичных ключей из последовательности таблицы,
+    чтобы отзывы можно было связать с объявлениями до их загрузки.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+            'FROM generate_series(1, %s)',
+            [model._meta.db_table, model._meta.pk.column, count])
+        return [pk for pk, in cursor.fetchall()]
+
+
+class Importer:
+    """
+    Загрузка объявлений и отзывов через COPY. Записи проверяются порциями
+    по chunk_size, авторы ищутся по email в словаре, загруженном один раз.
+    Отзывы ссылаются на объявления по колонке id файла объявлений.
+    Отклонённые строки собираются в rejected: (файл, строка, ошибки).
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.authors = {
+            email.lower(): pk for pk, email in
+            get_user_model().objects.values_list('pk', 'email')
+        }
+        self.ad_ids = {}
+        self.rejected = []
+
+    def chunks(self, records):
+        records = iter(records)
+        while chunk := list(islice(records, self.chunk_size)):
+            yield chunk
+
+    def clean(self, model, names, record):
+        if not isinstance(record, dict):
+            return None, {'record': ['Expected an object.']}
+
+        values, errors = {}, {}
+        for name in names:
+            try:
+                values[name] = model._meta.get_field(name).clean(
+                    record.get(name), None)
+            except ValidationError as error:
+                errors[name] = error.messages
+
+        author = str(record.get('author_email') or '').strip().lower()
+        values['author_id'] = self.authors.get(author)
+        if values['author_id'] is None:
+            errors['author_email'] = ['Unknown author.']
+
+        created_at = record.get('created_at')
+        try:
+            created_at = (model._meta.get_field('created_at').to_python(
+                created_at) if created_at else None)
+        except ValidationError as error:
+            errors['created_at'] = error.messages
+        else:
+            if created_at is not None and timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at)
+            values['created_at'] = created_at
+        return values, errors
+
+    def import_ads(self, path, records):
+        imported = 0
+        for chunk in self.chunks(records):
+            now = timezone.now()
+            rows, sources = [], []
+            for number, record in chunk:
+                values, errors = self.clean(
+                    Advertisement, ('title', 'price', 'description'), record)
+                if errors:
+                    self.rejected.append((path, number, errors))
+                    continue
+                rows.append((values['title'], values['price'],
+                             values['description'], values['author_id'],
+                             values['created_at'] or now, now, {}, 0))
+                sources.append(record.get('id'))
+            if not rows:
+                continue
+
+            ids = allocate_ids(Advertisement, len(rows))
+            with transaction.atomic():
+                copy_rows(Advertisement, ADVERTISEMENT_COLUMNS,
+                          [(pk, *row) for pk, row in zip(ids, rows)])
+            for source, pk in zip(sources, ids):
+                if source not in (None, ''):
+                    self.ad_ids[str(source)] = pk
+            imported += len(rows)
+
+        invalidate_responses()
+        return imported
+
+    def import_reviews(self, path, records):
+        imported = 0
+        for chunk in self.chunks(records):
+            now = timezone.now()
+            rows = []
+            for number, record in chunk:
+                values, errors = self.clean(Review, ('text',), record)
+                ad_id = (self.ad_ids.get(str(record.get('ad')))
+                         if values is not None else None)
+                if values is not None and ad_id is None:
+                    errors['ad'] = ['Unknown advertisement.']
+                if errors:
+                    self.rejected.append((path, number, errors))
+                    continue
+                rows.append((ad_id, values['author_id'], values['text'],
+                             values['created_at'] or now, now))
+            if not rows:
+                continue
+
+            ids = allocate_ids(Review, len(rows))
+            with transaction.atomic():
+                copy_rows(Review, REVIEW_COLUMNS,
+                          [(pk, *row) for pk, row in zip(ids, rows)])
+                # COPY не вызывает сигналы, поэтому счётчики отзывов
+                # пересчитываются для затронутых объявлений
+                Advertisement.objects.filter(
+                    pk__in={row[0] for row in rows}).refresh_review_stats()
+            imported += len(rows)
+
+        invalidate_responses()
+        return imported
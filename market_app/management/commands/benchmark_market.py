@@ -0,0 +1,59 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from market_app.benchmark import compare, dump, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон главных маршрутов API: пропускная '
+            'способность, p50/p95/p99 задержки и число запросов к базе '
+            'по сценариям, сравнение с сохранённым baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Адрес запущенного сервера; '
+                                          'по умолчанию прогон в процессе')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scenario', action='append', dest='only',
+                            help='Запустить только этот сценарий')
+        parser.add_argument('--cold', action='store_true',
+                            help='Без кэша ответов (только в процессе)')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--baseline', help='JSON прошлого прогона')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Допустимый рост задержки, доля')
+
+    def handle(self, *args, url, requests, concurrency, warmup, seed, only,
+               cold, output, baseline, tolerance, **options):
+        results = run_benchmark(url, requests, concurrency, warmup, seed,
+                                only, cold)
+
+        self.stdout.write(
+            f"{'scenario':<16}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+            f"{'queries':>9}{'errors':>8}")
+        for name, row in results['scenarios'].items():
+            self.stdout.write(
+                f"{name:<16}{row['rps']:>9}{row['p50_ms']:>9}"
+                f"{row['p95_ms']:>9}{row['p99_ms']:>9}"
+                f"{str(row['queries_max']):>9}{row['errors']:>8}")
+        if output:
+            dump(results, output)
+
+        if baseline:
+            with open(baseline, encoding='utf-8') as file:
+                previous = json.load(file)
+            for key in ('mode', 'cold', 'concurrency'):
+                if previous['meta'].get(key) != results['meta'][key]:
+                    raise CommandError(
+                        f'Baseline снят с другим параметром {key}: '
+                        f"{previous['meta'].get(key)}")
+            regressions = compare(results, previous, tolerance)
+            if regressions:
+                raise CommandError('Регрессия относительно baseline:\n'
+                                   + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(
+                'Регрессий относительно baseline нет'))
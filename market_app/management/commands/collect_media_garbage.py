@@ -0,0 +1,84 @@
+import posixpath
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from market_app.images import iter_variant_names
+from market_app.models import Advertisement, StoredFile
+from market_app.storage import HASHED_NAME
+
+
+def iter_files(storage, directory=''):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from iter_files(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = ('Удаляет загруженные файлы, на которые не осталось ссылок '
+            '(StoredFile.ref_count = 0), и файлы без StoredFile')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Не трогать файлы, отпущенные или записанные позже этого '
+                 'срока: их может ещё подхватить незавершённая загрузка')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, grace_hours, dry_run, **options):
+        cutoff = timezone.now() - timedelta(hours=grace_hours)
+        referenced = self.get_referenced_names()
+        orphans = StoredFile.objects.filter(ref_count=0,
+                                            updated_at__lt=cutoff)
+        removed = freed = 0
+        for pk, name in orphans.values_list('pk', 'name').iterator():
+            if name in referenced:
+                continue
+            with transaction.atomic():
+                stored = orphans.select_for_update().filter(pk=pk).first()
+                if stored is None:
+                    continue
+                if not dry_run:
+                    default_storage.purge(stored.name)
+                    stored.delete()
+                removed += 1
+                freed += stored.size
+
+        # Файлы, записанные в транзакции, которая откатилась
+        known = set(StoredFile.objects.values_list(
+            'name', flat=True).iterator())
+        for name in iter_files(default_storage):
+            if (name in known or name in referenced
+                    or not HASHED_NAME.match(name)
+                    or default_storage.get_modified_time(name) >= cutoff):
+                continue
+            size = default_storage.size(name)
+            if not dry_run:
+                default_storage.purge(name)
+            removed += 1
+            freed += size
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {removed}, освобождено байт: {freed}'
+            + (' (dry run)' if dry_run else '')))
+
+    @staticmethod
+    def get_referenced_names():
+        # Проверка по самим записям страхует от расхождения счётчика
+        names = set()
+        for model in (Advertisement, get_user_model()):
+            rows = model._base_manager.values_list('image', 'image_variants')
+            for image, variants in rows.iterator():
+                names.add(image)
+                names.add((variants or {}).get('source'))
+                names.update(iter_variant_names(variants))
+        names -= {None, ''}
+        return names
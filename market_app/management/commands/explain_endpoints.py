@@ -0,0 +1,169 @@
+from django.core.management import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils.http import urlencode
+from rest_framework_simplejwt.tokens import AccessToken
+
+from market_app.explain import analyze_plan, buffers, explain
+from market_app.models import Advertisement
+from users_app.models import User
+
+
+NAMESPACES = ('market_app', 'users_app')
+
+# Дополнительные параметры запроса для маршрутов, у которых от них
+# зависят запросы к базе
+EXTRA_QUERIES = {
+    'market_app:ads-list': [{}, {'search': 'велосипед'},
+                            {'pagination': 'cursor'}, {'page': 2}],
+    'market_app:ads-suggest': [{'q': 'вел'}],
+    'market_app:async-ads-list': [{}],
+}
+
+# Значения именованных частей адреса, кроме первичного ключа
+URL_KWARGS = {'export_format': None}
+
+
+def iter_routes(resolver=None, namespace=None):
+    """
+    Именованные маршруты приложений: (имя с пространством имён,
+    представление, имена параметров адреса).
+    """
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern,
+                                   pattern.app_name or namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name \
+                and namespace in NAMESPACES:
+            yield (f'{namespace}:{pattern.name}', pattern.callback,
+                   tuple(pattern.pattern.regex.groupindex))
+
+
+def allows_get(callback):
+    actions = getattr(callback, 'actions', None)
+    if actions is not None:
+        return 'get' in actions
+    view = getattr(callback, 'view_class', None) or getattr(
+        callback, 'cls', None)
+    return view is None or hasattr(view, 'get')
+
+
+def get_model(callback):
+    view = getattr(callback, 'cls', None) or getattr(
+        callback, 'view_class', None)
+    queryset = getattr(view, 'queryset', None)
+    return queryset.model if queryset is not None else None
+
+
+class Command(BaseCommand):
+    help = ('Выполняет GET-запросы ко всем маршрутам market_app и users_app, '
+            'собирает их SQL, запускает EXPLAIN (ANALYZE, BUFFERS) '
+            'и предлагает индексы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Пользователь для запросов; '
+                                            'по умолчанию автор с наибольшим '
+                                            'числом объявлений')
+        parser.add_argument('--route', action='append', dest='routes',
+                            help='Только маршруты, содержащие подстроку')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Порог строк для замечания о Seq Scan')
+        parser.add_argument('--max-cost', type=float, default=1000)
+
+    def handle(self, *args, email, routes, min_rows, max_cost, **options):
+        user = self.get_user(email)
+        client = Client(HTTP_HOST='localhost')
+        if user is not None:
+            client.defaults['HTTP_AUTHORIZATION'] = (
+                f'Bearer {AccessToken.for_user(user)}')
+
+        suggestions = []
+        # Кэш ответов отключён, иначе повторные запросы не дойдут до базы.
+        # Чтения не уходят в реплику: запросы перехватываются и EXPLAIN
+        # выполняется на соединении основной базы
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0,
+                               REPLICA_DATABASE=None):
+            for name, callback, kwargs_names in iter_routes():
+                if 'format' in kwargs_names or not allows_get(callback):
+                    continue
+                if routes and not any(part in name for part in routes):
+                    continue
+                kwargs = self.get_url_kwargs(callback, kwargs_names)
+                if kwargs is None:
+                    self.stdout.write(f'{name}: пропущен, нет данных')
+                    continue
+                for query in EXTRA_QUERIES.get(name, [{}]):
+                    url = reverse(name, kwargs=kwargs)
+                    if query:
+                        url += '?' + urlencode(query)
+                    for index in self.explain_url(client, url, min_rows,
+                                                  max_cost):
+                        if index not in suggestions:
+                            suggestions.append(index)
+
+        self.stdout.write('')
+        if suggestions:
+            self.stdout.write(self.style.WARNING('Предлагаемые индексы:'))
+            for index in suggestions:
+                self.stdout.write(f'  {index}')
+        else:
+            self.stdout.write(self.style.SUCCESS('Замечаний нет'))
+
+    def get_user(self, email):
+        if email:
+            return User.objects.get(email=email)
+        author_id = Advertisement.objects.order_by().values(
+            'author').annotate(
+            total=Count('pk')).order_by('-total').values_list(
+            'author', flat=True).first()
+        if author_id is None:
+            return User.objects.order_by('pk').first()
+        return User.objects.get(pk=author_id)
+
+    def get_url_kwargs(self, callback, names):
+        kwargs = {}
+        for name in names:
+            if name in URL_KWARGS:
+                # Потоковая выгрузка читает всю таблицу: не анализируется
+                return None
+            model = get_model(callback)
+            if model is None:
+                return None
+            pk = model._default_manager.order_by('-pk').values_list(
+                'pk', flat=True).first()
+            if pk is None:
+                return None
+            kwargs[name] = pk
+        return kwargs
+
+    def explain_url(self, client, url, min_rows, max_cost):
+        captured = []
+
+        def capture(execute, sql, params, many, context):
+            captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = client.get(url)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'GET {url} -> {response.status_code}, '
+            f'запросов: {len(captured)}'))
+
+        suggestions = []
+        for sql, params in captured:
+            if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                continue
+            plan = explain(sql, params)
+            notes, indexes = analyze_plan(plan, min_rows, max_cost)
+            used = buffers(plan)
+            self.stdout.write(
+                f"  {plan['Execution Time']:.2f} ms, buffers hit "
+                f"{used['hit']} read {used['read']}: {sql[:150]}")
+            for note in notes:
+                self.stdout.write(self.style.WARNING(f'    ! {note}'))
+            suggestions.extend(indexes)
+        return suggestions
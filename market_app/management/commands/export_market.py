@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from market_app.export import CHUNK_SIZE, EXPORTS, FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = ('Выгружает все объявления или отзывы в NDJSON или CSV, '
+            'читая их серверным курсором')
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='export_format',
+                            choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', help='Файл; по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, resource, export_format, output, chunk_size,
+               **options):
+        model, fields = EXPORTS[resource]
+        lines = export_lines(model.objects.all(), fields, export_format,
+                             chunk_size)
+        if output is None:
+            for block in lines:
+                self.stdout.write(block, ending='')
+            return
+
+        with open(output, 'w', encoding='utf-8', newline='') as file:
+            for block in lines:
+                file.write(block)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгрузка записана в {output}'))
@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from market_app.importer import CHUNK_SIZE, Importer, read_records
+
+
+FORMATS = ('csv', 'ndjson')
+
+
+class Command(BaseCommand):
+    help = ('Загружает объявления и отзывы из CSV или NDJSON через '
+            'COPY FROM STDIN. Авторы указываются в колонке author_email, '
+            'отзывы ссылаются на колонку id файла объявлений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ads', help='Файл объявлений')
+        parser.add_argument('--reviews', help='Файл отзывов')
+        parser.add_argument('--format', dest='file_format', choices=FORMATS,
+                            help='По умолчанию определяется по расширению')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def get_format(self, path, file_format):
+        if file_format is None:
+            file_format = os.path.splitext(path)[1].lstrip('.').lower()
+            if file_format == 'jsonl':
+                file_format = 'ndjson'
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        return file_format
+
+    def handle(self, *args, ads, reviews, file_format, chunk_size,
+               **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Загрузка через COPY требует PostgreSQL')
+
+        started = time.monotonic()
+        importer = Importer(chunk_size)
+        ads_count = importer.import_ads(
+            ads, read_records(ads, self.get_format(ads, file_format)))
+        reviews_count = 0
+        if reviews:
+            reviews_count = importer.import_reviews(
+                reviews,
+                read_records(reviews, self.get_format(reviews, file_format)))
+        elapsed = time.monotonic() - started
+
+        for path, number, errors in importer.rejected:
+            self.stderr.write(f'{path}:{number}: {errors}')
+        total = ads_count + reviews_count + len(importer.rejected)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено объявлений: {ads_count}, отзывов: {reviews_count}, '
+            f'отклонено строк: {len(importer.rejected)}. '
+            f'Время: {elapsed:.2f} с, {total / max(elapsed, 1e-6):.0f} строк/с'
+        ))
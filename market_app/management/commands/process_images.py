@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from market_app.images import needs_processing, process_image
+from market_app.models import Advertisement
+from market_app.signals import advertisement_image_processed
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии и WebP-варианты изображений, '
+            'которые ещё не обработаны фоновым пулом')
+
+    def handle(self, *args, **options):
+        targets = (
+            (Advertisement, advertisement_image_processed),
+            (get_user_model(), None),
+        )
+        for model, on_processed in targets:
+            processed = 0
+            # Изображение есть, или остались варианты удалённого изображения
+            queryset = model._base_manager.filter(
+                ~Q(image='') & Q(image__isnull=False)
+                | ~Q(image_variants={})
+            ).only('image', 'image_variants').order_by('pk')
+            for instance in queryset.iterator():
+                if needs_processing(instance):
+                    process_image(model, instance.pk, on_processed)
+                    processed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: обработано {processed}'))
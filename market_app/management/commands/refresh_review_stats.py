@@ -0,0 +1,44 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, Max
+
+from market_app.models import Advertisement, Review
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает review_count и last_reviewed_at объявлений '
+            'и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        checked = repaired = 0
+        last_id = 0
+        while True:
+            ads = list(
+                Advertisement.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', 'review_count', 'last_reviewed_at')
+                [:batch_size]
+            )
+            if not ads:
+                break
+            ids = [pk for pk, _, _ in ads]
+
+            actual = {
+                row['ad']: (row['count'], row['last'])
+                for row in Review.objects.filter(ad__in=ids).order_by()
+                .values('ad').annotate(count=Count('pk'),
+                                       last=Max('created_at'))
+            }
+            stale = [pk for pk, count, last in ads
+                     if actual.get(pk, (0, None)) != (count, last)]
+            if stale:
+                repaired += Advertisement.objects.filter(
+                    pk__in=stale).refresh_review_stats()
+
+            checked += len(ads)
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено объявлений: {checked}, исправлено: {repaired}'))
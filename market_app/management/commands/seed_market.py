@@ -0,0 +1,170 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from market_app.cache import invalidate_responses
+from market_app.importer import (ADVERTISEMENT_COLUMNS, REVIEW_COLUMNS,
+                                 allocate_ids, copy_rows)
+from market_app.models import Advertisement, Review
+from users_app.models import User
+
+
+NOUNS = ('велосипед', 'диван', 'ноутбук', 'телефон', 'холодильник',
+         'коляска', 'шкаф', 'куртка', 'кроссовки', 'телевизор', 'стол',
+         'палатка', 'гитара', 'микроволновка', 'пылесос', 'самокат',
+         'монитор', 'фотоаппарат', 'часы', 'кресло', 'сумка', 'лыжи',
+         'принтер', 'планшет', 'наушники', 'чайник', 'матрас', 'ковёр')
+ADJECTIVES = ('новый', 'почти новый', 'б/у', 'отличный', 'недорогой',
+              'детский', 'складной', 'кожаный', 'белый', 'чёрный',
+              'компактный', 'винтажный', 'рабочий', 'мощный', 'лёгкий')
+PHRASES = ('в хорошем состоянии', 'без царапин', 'полный комплект',
+           'есть чек и коробка', 'торг уместен', 'самовывоз из центра',
+           'возможна доставка', 'пользовались аккуратно', 'срочно',
+           'продаю в связи с переездом', 'работает исправно',
+           'обмен не интересует', 'звоните вечером', 'цена окончательная',
+           'подойдёт для дачи', 'гарантия ещё действует')
+REVIEW_PHRASES = ('всё как в описании', 'продавец вежливый',
+                  'быстро договорились', 'цена завышена', 'рекомендую',
+                  'товар уже продан', 'не отвечает на звонки',
+                  'состояние хуже, чем на фото', 'отличная сделка',
+                  'встретились вовремя', 'спасибо за честность')
+
+
+class ZipfSampler:
+    """
+    Выбор индекса 0..n-1 с вероятностью, пропорциональной 1 / (k + 1)^s:
+    немногие индексы выпадают часто, большинство — редко. Индексы
+    перемешаны, чтобы популярность не совпадала с порядком вставки.
+    """
+
+    def __init__(self, rng, n, exponent):
+        self.rng = rng
+        self.order = list(range(n))
+        rng.shuffle(self.order)
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** exponent for rank in range(n)))
+
+    def sample(self, k):
+        ranks = self.rng.choices(range(len(self.order)),
+                                 cum_weights=self.cum_weights, k=k)
+        return [self.order[rank] for rank in ranks]
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, объявлениями '
+            'и отзывами для нагрузочных тестов: число отзывов на объявление '
+            'и объявлений на автора распределены по Ципфу')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--ads', type=int, default=10000)
+        parser.add_argument('--reviews', type=int, default=50000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить даты')
+
+    def handle(self, *args, users, ads, reviews, seed, batch_size, exponent,
+               days, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Загрузка через COPY требует PostgreSQL')
+        if users < 1 or (reviews and not ads):
+            raise CommandError('Нужен хотя бы один пользователь, а для '
+                               'отзывов — хотя бы одно объявление')
+
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.period = timedelta(days=days).total_seconds()
+
+        user_ids = self.timed('Пользователи', self.seed_users, users)
+        ad_ids, ad_dates = self.timed(
+            'Объявления', self.seed_ads, ads,
+            ZipfSampler(self.rng, len(user_ids), exponent), user_ids)
+        if reviews:
+            self.timed('Отзывы', self.seed_reviews, reviews,
+                       ZipfSampler(self.rng, len(ad_ids), exponent),
+                       ad_ids, ad_dates, user_ids)
+            self.timed('Счётчики отзывов', self.refresh_stats, ad_ids)
+        invalidate_responses()
+
+    def timed(self, title, func, *args):
+        started = time.monotonic()
+        result = func(*args)
+        self.stdout.write(f'{title}: {time.monotonic() - started:.1f} с')
+        return result
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def random_date(self, after=None):
+        if after is None:
+            return self.now - timedelta(
+                seconds=self.rng.random() * self.period)
+        span = (self.now - after).total_seconds()
+        return after + timedelta(seconds=self.rng.random() * span)
+
+    def seed_users(self, total):
+        password = make_password(None)
+        user_ids = []
+        for size in self.batches(total):
+            ids = allocate_ids(User, size)
+            User.objects.bulk_create(
+                User(pk=pk, email=f'user{pk}@seed.example',
+                     first_name=self.rng.choice(('Анна', 'Иван', 'Олег',
+                                                 'Мария', 'Пётр', 'Юлия')),
+                     last_name=f'Тестов{pk}', password=password,
+                     date_joined=self.random_date())
+                for pk in ids)
+            user_ids.extend(ids)
+        return user_ids
+
+    def seed_ads(self, total, authors, user_ids):
+        rng = self.rng
+        ad_ids, ad_dates = [], []
+        for size in self.batches(total):
+            ids = allocate_ids(Advertisement, size)
+            rows = []
+            for pk, author in zip(ids, authors.sample(size)):
+                created_at = self.random_date()
+                title = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+                description = ', '.join(
+                    rng.sample(PHRASES, rng.randint(2, 6))).capitalize()
+                price = round(rng.lognormvariate(8, 1.2), -1) or 10
+                rows.append((pk, title.capitalize(), price, description,
+                             user_ids[author], created_at, created_at, {}, 0))
+                ad_dates.append(created_at)
+            with transaction.atomic():
+                copy_rows(Advertisement, ADVERTISEMENT_COLUMNS, rows)
+            ad_ids.extend(ids)
+        return ad_ids, ad_dates
+
+    def seed_reviews(self, total, targets, ad_ids, ad_dates, user_ids):
+        rng = self.rng
+        for size in self.batches(total):
+            ids = allocate_ids(Review, size)
+            rows = []
+            for pk, ad in zip(ids, targets.sample(size)):
+                created_at = self.random_date(after=ad_dates[ad])
+                text = '. '.join(rng.sample(REVIEW_PHRASES,
+                                            rng.randint(1, 3))).capitalize()
+                rows.append((pk, ad_ids[ad], rng.choice(user_ids), text,
+                             created_at, created_at))
+            with transaction.atomic():
+                copy_rows(Review, REVIEW_COLUMNS, rows)
+
+    def refresh_stats(self, ad_ids):
+        # COPY не вызывает сигналы: счётчики пересчитываются по диапазонам
+        for start in range(0, len(ad_ids), self.batch_size):
+            Advertisement.objects.filter(
+                pk__in=ad_ids[start:start + self.batch_size]
+            ).refresh_review_stats()
@@ -0,0 +1,153 @@
+import ipaddress
+import os
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from rest_framework.serializers import ListSerializer
+
+from market_app.querybudget import get_endpoint
+
+
+# При нескольких процессах-воркерах prometheus_client пишет значения
+# в файлы каталога PROMETHEUS_MULTIPROC_DIR, а /metrics их суммирует.
+# Переменную нужно задать до запуска сервера и очищать при старте.
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса',
+    ['endpoint', 'method', 'status'])
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Запросы в обработке',
+    multiprocess_mode='livesum')
+DB_QUERIES = Histogram(
+    'db_queries_per_request', 'Число запросов к базе на HTTP-запрос',
+    ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, float('inf')))
+DB_TIME = Histogram(
+    'db_query_duration_seconds', 'Суммарное время запросов к базе '
+    'на HTTP-запрос', ['endpoint'])
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Обращения к кэшам; доля попаданий — '
+    'hit / (hit + miss)', ['cache', 'result'])
+SERIALIZER_TIME = Histogram(
+    'serializer_duration_seconds', 'Время сериализации ответа',
+    ['serializer'])
+
+
+def observe_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+@contextmanager
+def observe_serializer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SERIALIZER_TIME.labels(name).observe(time.perf_counter() - started)
+
+
+class TimedListSerializer(ListSerializer):
+
+    @property
+    def data(self):
+        with observe_serializer(type(self.child).__name__):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Время построения .data сериализатора отдельно от остальной работы
+    представления. Для списков нужен Meta.list_serializer_class =
+    TimedListSerializer.
+    """
+
+    @property
+    def data(self):
+        with observe_serializer(type(self).__name__):
+            return super().data
+
+
+class MetricsMiddleware:
+    """
+    Время ответа по эндпоинтам, число запросов в обработке и запросы
+    к базе. Статистику запросов к базе собирает QueryBudgetMiddleware,
+    который должен стоять ниже в MIDDLEWARE.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = self.get_response(request)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+        self.observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = await self.get_response(request)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+        self.observe(request, response, started)
+        return response
+
+    def observe(self, request, response, started):
+        endpoint = get_endpoint(request) or 'unmatched'
+        REQUEST_LATENCY.labels(endpoint, request.method,
+                               response.status_code).observe(
+            time.perf_counter() - started)
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            DB_QUERIES.labels(endpoint).observe(stats.count)
+            DB_TIME.labels(endpoint).observe(stats.time)
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def is_metrics_allowed(request):
+    """
+    Запрос пришёл из сети METRICS_ALLOWED_NETWORKS или от администратора,
+    вошедшего через админку.
+    """
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        address = None
+    if address is not None and any(
+            address in ipaddress.ip_network(network.strip(), strict=False)
+            for network in settings.METRICS_ALLOWED_NETWORKS
+            if network.strip()):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus (см. is_metrics_allowed).
+    """
+    if not is_metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_registry()),
+                        content_type=CONTENT_TYPE_LATEST)
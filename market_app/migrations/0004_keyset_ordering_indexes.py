@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0003_alter_advertisement_author_alter_review_author'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='advertisement',
+            options={'ordering': ('-created_at', '-id'), 'verbose_name': 'Объявление', 'verbose_name_plural': 'Объявления'},
+        ),
+        migrations.AlterModelOptions(
+            name='review',
+            options={'ordering': ('-created_at', '-id'), 'verbose_name': 'Отзыв', 'verbose_name_plural': 'Отзывы'},
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['-created_at', '-id'], name='market_adv_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at', '-id'], name='market_rev_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:52
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Конфигурация должна совпадать с SEARCH_CONFIG в market_app/filters.py
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION market_app_advertisement_search_vector(title text,
+                                                       description text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+           setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE FUNCTION market_app_advertisement_search_vector_trigger()
+RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := market_app_advertisement_search_vector(
+        NEW.title, NEW.description);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER market_app_advertisement_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description
+    ON market_app_advertisement
+    FOR EACH ROW
+    EXECUTE FUNCTION market_app_advertisement_search_vector_trigger();
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS market_app_advertisement_search_vector_update
+    ON market_app_advertisement;
+DROP FUNCTION IF EXISTS market_app_advertisement_search_vector_trigger();
+DROP FUNCTION IF EXISTS market_app_advertisement_search_vector(text, text);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0004_keyset_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_SQL, DROP_SEARCH_VECTOR_SQL),
+    ]
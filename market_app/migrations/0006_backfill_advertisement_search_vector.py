@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:52
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_search_vector(apps, schema_editor):
+    """
+    Заполняет search_vector существующих объявлений пачками, каждая в своей
+    транзакции, чтобы не держать блокировку на всю таблицу.
+    """
+    Advertisement = apps.get_model('market_app', 'Advertisement')
+    connection = schema_editor.connection
+    last_id = 0
+    while True:
+        with transaction.atomic(using=connection.alias):
+            ids = list(
+                Advertisement.objects.using(connection.alias)
+                .filter(id__gt=last_id, search_vector__isnull=True)
+                .order_by('id')
+                .values_list('id', flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE market_app_advertisement "
+                    "SET search_vector = "
+                    "market_app_advertisement_search_vector(title, description) "
+                    "WHERE id = ANY(%s)",
+                    [ids]
+                )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('market_app', '0005_advertisement_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_vector,
+                             migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='market_adv_search_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:53
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import (AddIndexConcurrently,
+                                                TrigramExtension)
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('market_app', '0006_backfill_advertisement_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='market_adv_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:54
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models, transaction
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_review_stats(apps, schema_editor):
+    """
+    Заполняет review_count и last_reviewed_at существующих объявлений
+    пачками, каждая в своей транзакции.
+    """
+    Advertisement = apps.get_model('market_app', 'Advertisement')
+    Review = apps.get_model('market_app', 'Review')
+    alias = schema_editor.connection.alias
+    reviews = Review.objects.using(alias).filter(
+        ad=models.OuterRef('pk')).order_by()
+    count = reviews.values('ad').annotate(
+        count=models.Count('pk')).values('count')
+    last = reviews.order_by('-created_at').values('created_at')[:1]
+
+    last_id = 0
+    while True:
+        with transaction.atomic(using=alias):
+            ids = list(
+                Advertisement.objects.using(alias)
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+            Advertisement.objects.using(alias).filter(id__in=ids).update(
+                review_count=Coalesce(models.Subquery(count), 0),
+                last_reviewed_at=models.Subquery(last)
+            )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('market_app', '0007_advertisement_title_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='last_reviewed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='date of last review'),
+        ),
+        migrations.AddField(
+            model_name='advertisement',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of reviews'),
+        ),
+        migrations.RunPython(backfill_review_stats,
+                             migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(fields=['-review_count', '-created_at'], name='market_adv_review_count_idx'),
+        ),
+    ]
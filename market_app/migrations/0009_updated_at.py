@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0008_advertisement_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='date of change'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='date of change'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='image_variants',
+            field=models.JSONField(default=dict, editable=False, verbose_name='image variants'),
+        ),
+    ]
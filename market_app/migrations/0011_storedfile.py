@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0010_advertisement_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='name')),
+                ('size', models.PositiveBigIntegerField(verbose_name='size')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='number of references')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date of change')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+                'indexes': [models.Index(condition=models.Q(('ref_count', 0)), fields=['updated_at'], name='market_file_orphan_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:21
+
+from django.conf import settings
+from django.contrib.postgres.operations import (AddIndexConcurrently,
+                                                RemoveIndexConcurrently)
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('market_app', '0011_storedfile'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='advertisement',
+            name='market_adv_review_count_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(fields=['price', 'id'], name='market_adv_price_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(fields=['-review_count', '-created_at', '-id'], name='market_adv_review_count_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='market_adv_author_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='advertisement',
+            name='author',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(fields=['author', 'price', 'id'], name='market_adv_author_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(fields=['author', '-review_count', '-created_at', '-id'], name='market_adv_author_reviews_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['-created_at', '-id'], name='market_adv_image_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['price', 'id'], name='market_adv_image_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='advertisement',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['-review_count', '-created_at', '-id'], name='market_adv_image_reviews_idx'),
+        ),
+    ]
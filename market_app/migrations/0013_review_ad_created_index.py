@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:24
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('market_app', '0012_advertisement_filter_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='review',
+            index=models.Index(fields=['ad', '-created_at', '-id'], name='market_rev_ad_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='ad',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='market_app.advertisement'),
+        ),
+    ]
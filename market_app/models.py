@@ -1,38 +1,241 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchVectorField,
+                                            TrigramWordSimilarity)
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest, Now
 from django.utils.translation import gettext_lazy as _
 from config import settings
 
 
 NULLABLE = {'blank': True, 'null': True}
 
+# Условие частичных индексов и фильтра ?has_image=true: пустое имя
+# файла и NULL под него не попадают
+HAS_IMAGE = models.Q(image__gt='')
+
+# Сколько последних отзывов встраивается в объявление
+LATEST_REVIEWS = 3
+
+
+class AdvertisementQuerySet(models.QuerySet):
+    def with_reviews(self, limit=LATEST_REVIEWS):
+        """
+        Подгружает limit последних отзывов каждого объявления одним
+        запросом в атрибут latest_reviews: срез в Prefetch выполняется
+        оконной функцией ROW_NUMBER по индексу market_rev_ad_created_idx.
+        Количество отзывов хранится в самом объявлении (review_count),
+        все отзывы отдаёт ads/{id}/reviews/.
+        """
+        # Срез совместим только с to_attr: менеджер review_set
+        # фильтрует полученный queryset и падает на срезе
+        return self.prefetch_related(
+            models.Prefetch('review_set',
+                            queryset=Review.objects.only('ad', 'text')
+                            .order_by('-created_at', '-id')[:limit],
+                            to_attr='latest_reviews')
+        )
+
+    def review_added(self, created_at):
+        return self.update(
+            review_count=models.F('review_count') + 1,
+            last_reviewed_at=Greatest('last_reviewed_at',
+                                      models.Value(created_at)),
+            updated_at=Now()
+        )
+
+    def review_removed(self):
+        return self.update(
+            review_count=Greatest(
+                models.F('review_count') - 1, 0,
+                output_field=models.PositiveIntegerField()
+            ),
+            last_reviewed_at=self._last_review_subquery(),
+            updated_at=Now()
+        )
+
+    def touch(self):
+        """
+        Сдвигает версию объявления (updated_at), когда меняются
+        встроенные в него отзывы.
+        """
+        return self.update(updated_at=Now())
+
+    def refresh_review_stats(self):
+        """
+        Пересчитывает review_count и last_reviewed_at по таблице отзывов.
+        """
+        count = Review.objects.filter(
+            ad=models.OuterRef('pk')
+        ).order_by().values('ad').annotate(
+            count=models.Count('pk')
+        ).values('count')
+        return self.update(
+            review_count=Coalesce(models.Subquery(count), 0),
+            last_reviewed_at=self._last_review_subquery(),
+            updated_at=Now()
+        )
+
+    @staticmethod
+    def _last_review_subquery():
+        return models.Subquery(
+            Review.objects.filter(
+                ad=models.OuterRef('pk')
+            ).order_by('-created_at').values('created_at')[:1]
+        )
+
+    def suggest_titles(self, query, limit):
+        """
+        Заголовки, похожие на начало или часть запроса с учётом опечаток.
+        Оператор %> (word_similarity) обслуживается триграммным индексом.
+        """
+        return list(
+            self.filter(title__trigram_word_similar=query)
+            .values('title')
+            .annotate(similarity=models.Max(
+                TrigramWordSimilarity(query, 'title')))
+            .order_by('-similarity', 'title')
+            .values_list('title', flat=True)[:limit]
+        )
+
+
+class AdvertisementManager(
+        models.Manager.from_queryset(AdvertisementQuerySet)):
+    def get_queryset(self):
+        # search_vector заполняет триггер в базе, читать его в Python
+        # и записывать обратно при save() не нужно
+        return super().get_queryset().defer('search_vector')
+
 
 class Advertisement(models.Model):
     title = models.CharField(_("title"), max_length=150)
     price = models.DecimalField(_("price"), max_digits=10, decimal_places=2)
     description = models.TextField(_("description"))
+    # Отдельный индекс не нужен: author_id открывает составные индексы
     author = models.ForeignKey(settings.AUTH_USER_MODEL,
-                               on_delete=models.CASCADE, **NULLABLE)
+                               on_delete=models.CASCADE, db_index=False,
+                               **NULLABLE)
     created_at = models.DateTimeField(_("date of creation"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("date of change"), auto_now=True)
     image = models.ImageField(_("preview of advirtisement"),
                               upload_to='images/', **NULLABLE)
+    image_variants = models.JSONField(_("image variants"), default=dict,
+                                      editable=False)
+    search_vector = SearchVectorField(editable=False, **NULLABLE)
+    review_count = models.PositiveIntegerField(_("number of reviews"),
+                                               default=0, editable=False)
+    last_reviewed_at = models.DateTimeField(_("date of last review"),
+                                            editable=False, **NULLABLE)
+
+    objects = AdvertisementManager()
+
+    # Меняются только атомарными UPDATE: при создании и удалении отзывов
+    # и после фоновой обработки изображения
+    DERIVED_FIELDS = ('review_count', 'last_reviewed_at', 'image_variants')
 
     class Meta:
-        ordering = ('-created_at',)
+        ordering = ('-created_at', '-id')
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='market_adv_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='market_adv_search_idx'),
+            GinIndex(fields=['title'], name='market_adv_title_trgm_idx',
+                     opclasses=['gin_trgm_ops']),
+            # Сортировки ?ordering (AdvertisementOrderingFilter): индекс
+            # на каждое поле, в том числе с фильтром по автору и только
+            # по объявлениям с изображением. Диапазон по полю сортировки
+            # сужает сканирование того же индекса
+            models.Index(fields=['price', 'id'],
+                         name='market_adv_price_id_idx'),
+            models.Index(fields=['-review_count', '-created_at', '-id'],
+                         name='market_adv_review_count_idx'),
+            models.Index(fields=['author', '-created_at', '-id'],
+                         name='market_adv_author_created_idx'),
+            models.Index(fields=['author', 'price', 'id'],
+                         name='market_adv_author_price_idx'),
+            models.Index(fields=['author', '-review_count', '-created_at',
+                                 '-id'],
+                         name='market_adv_author_reviews_idx'),
+            models.Index(fields=['-created_at', '-id'], condition=HAS_IMAGE,
+                         name='market_adv_image_created_idx'),
+            models.Index(fields=['price', 'id'], condition=HAS_IMAGE,
+                         name='market_adv_image_price_idx'),
+            models.Index(fields=['-review_count', '-created_at', '-id'],
+                         condition=HAS_IMAGE,
+                         name='market_adv_image_reviews_idx'),
+        ]
 
         verbose_name = "Объявление"
         verbose_name_plural = "Объявления"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Нужен сигналам, чтобы отпустить ссылку на заменённый файл
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Не перезаписываем производные поля значениями, прочитанными
+        # до сохранения: их мог изменить параллельный запрос
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.get_deferred_fields())
+            skipped.update(self.DERIVED_FIELDS)
+            # Обработчик изображений заменяет файл на очищенный от
+            # метаданных, неизменённое имя файла обратно не пишем
+            if self.image.name == getattr(self, '_loaded_image', None):
+                skipped.add('image')
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
 
 class Review(models.Model):
     text = models.TextField(_("review's text"))
     author = models.ForeignKey(settings.AUTH_USER_MODEL,
                                on_delete=models.CASCADE, **NULLABLE)
+    # Отдельный индекс не нужен: ad_id открывает market_rev_ad_created_idx
     ad = models.ForeignKey(Advertisement,
-                           on_delete=models.CASCADE)
+                           on_delete=models.CASCADE, db_index=False)
     created_at = models.DateTimeField(_("date of creation"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("date of change"), auto_now=True)
 
     class Meta:
-        ordering = ('-created_at',)
+        ordering = ('-created_at', '-id')
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='market_rev_created_id_idx'),
+            # Отзывы объявления по страницам и последние отзывы для
+            # встраивания
+            models.Index(fields=['ad', '-created_at', '-id'],
+                         name='market_rev_ad_created_idx'),
+        ]
 
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Нужен сигналам, чтобы при переносе отзыва обновить оба объявления
+        instance._loaded_ad_id = instance.__dict__.get('ad_id')
+        return instance
+
+
+class StoredFile(models.Model):
+    name = models.CharField(_("name"), max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(_("size"))
+    ref_count = models.PositiveIntegerField(_("number of references"),
+                                            default=0)
+    updated_at = models.DateTimeField(_("date of change"), auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'],
+                         condition=models.Q(ref_count=0),
+                         name='market_file_orphan_idx'),
+        ]
+
+        verbose_name = "Файл"
+        verbose_name_plural = "Файлы"
@@ -1,9 +1,192 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
 
 
-class AdvertisementPaginator(PageNumberPagination):
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация по составному ключу (-created_at, -id).
+
+    Стандартный CursorPagination хранит в курсоре только первое поле
+    сортировки и добирает совпадения через OFFSET. Здесь позиция включает
+    id, поэтому любая страница выбирается одним условием по индексу,
+    без COUNT(*) и OFFSET.
+    """
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page([item async for item in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Запрос страницы (с одной лишней записью, чтобы узнать, есть ли
+        следующая) без его выполнения.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, position = False, None
+        else:
+            reverse = self.cursor.reverse
+            position = self._parse_position(self.cursor.position)
+
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+
+        if position is not None:
+            created_at, pk = position
+            # Условие на created_at отдельно от OR, чтобы планировщик
+            # мог начать сканирование индекса с нужной позиции
+            if reverse:
+                queryset = queryset.filter(created_at__gte=created_at).filter(
+                    Q(created_at__gt=created_at) | Q(id__gt=pk))
+            else:
+                queryset = queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+        self.reverse, self.position = reverse, position
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], None)
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], None)
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            # Строка из .values() (market_app.fastpath)
+            return f"{instance['created_at'].isoformat()}|{instance['id']}"
+        return f'{instance.created_at.isoformat()}|{instance.pk}'
+
+    def _parse_position(self, position):
+        try:
+            created_at, pk = position.rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+
+class SelectablePagination(PageNumberPagination):
+    """
+    Постраничная пагинация, которую клиент может переключить на курсорную
+    параметром ?pagination=cursor (или сразу передав cursor). Клиенты,
+    которые ходят по ?page=N, продолжают работать как раньше.
+    """
+    cursor_pagination_class = None
+    pagination_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request,
+                                                           view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        То же, что paginate_queryset, для асинхронных представлений:
+        COUNT(*) и выборка страницы выполняются асинхронным ORM.
+        """
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return await self.cursor_paginator.apaginate_queryset(
+                queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator берёт готовое значение count вместо своего запроса
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        self.page.object_list = [item async for item in self.page.object_list]
+        return self.page.object_list
+
+    def use_cursor(self, request):
+        if self.cursor_pagination_class is None:
+            return False
+        params = request.query_params
+        return (params.get(self.pagination_query_param) == 'cursor'
+                or self.cursor_pagination_class.cursor_query_param in params)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
+
+
+class AdvertisementCursorPaginator(KeysetPagination):
+    page_size = 4
+
+
+class ReviewCursorPaginator(KeysetPagination):
+    page_size = 10
+
+
+class AdvertisementPaginator(SelectablePagination):
     page_size = 4
+    cursor_pagination_class = AdvertisementCursorPaginator
 
 
-class ReviewPaginator(PageNumberPagination):
+class ReviewPaginator(SelectablePagination):
     page_size = 10
+    cursor_pagination_class = ReviewCursorPaginator
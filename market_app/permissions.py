@@ -5,4 +5,13 @@ class IsAuthorOrAdmin(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_admin:
             return True
-        return obj.author == request.user
+        return obj.author_id == request.user.pk
+
+    def filter_queryset(self, request, queryset):
+        """
+        Оставляет в queryset только объекты, которые пользователь может
+        изменять, — проверка сразу для множества объектов.
+        """
+        if request.user.is_admin:
+            return queryset
+        return queryset.filter(author_id=request.user.pk)
@@ -0,0 +1,173 @@
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Журналы активных record_queries()
+_logs = []
+# QueryStats текущего HTTP-запроса. Переменная контекста видна и в потоке
+# sync_to_async, где под ASGI выполняются запросы к базе
+_current_stats = ContextVar('query_stats', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats:
+    """
+    Запросы к базе, выполненные при обработке одного HTTP-запроса.
+    Подключается к соединениям через execute_wrapper.
+    """
+
+    def __init__(self):
+        self.endpoint = None
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """
+        Одинаковые по тексту запросы, выполненные больше одного раза, —
+        обычно признак N+1.
+        """
+        counter = Counter(sql for sql, _ in self.queries)
+        return {sql: count for sql, count in counter.items() if count > 1}
+
+    def describe(self):
+        lines = [f'{self.endpoint}: {self.count} queries, '
+                 f'{self.time * 1000:.1f} ms']
+        for sql, count in self.duplicates.items():
+            lines.append(f'  {count}x {sql}')
+        return '\n'.join(lines)
+
+
+def _record(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_recorder(connection, **kwargs):
+    """
+    Обработчик connection_created: подключает к соединению запись
+    запросов в QueryStats текущего HTTP-запроса. Соединения с базой
+    у каждого потока свои, поэтому обёртка ставится один раз при
+    подключении, а не на время запроса. Она встаёт первой в списке,
+    чтобы не мешать execute_wrapper(), который снимает последнюю.
+    """
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record)
+
+
+def get_endpoint(request):
+    """
+    Имя эндпоинта вида AdvertisementViewSet.list: класс представления
+    и действие ViewSet или HTTP-метод.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view = getattr(match.func, 'view_class', None) or getattr(
+        match.func, 'cls', None)
+    if view is None:
+        return match.func.__name__
+    method = request.method.lower()
+    action = (getattr(match.func, 'actions', None) or {}).get(method, method)
+    return f'{view.__name__}.{action}'
+
+
+def get_budget(endpoint):
+    return settings.QUERY_BUDGETS.get(endpoint, settings.QUERY_BUDGET_DEFAULT)
+
+
+@contextmanager
+def record_queries():
+    """
+    Собирает QueryStats всех запросов к API внутри блока:
+    {эндпоинт: [QueryStats, ...]}.
+    """
+    log = defaultdict(list)
+    _logs.append(log)
+    try:
+        yield log
+    finally:
+        _logs.remove(log)
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает запросы к базе для каждого HTTP-запроса (request.query_stats,
+    см. install_recorder) и сравнивает их с бюджетом эндпоинта
+    (QUERY_BUDGETS). При DEBUG превышение пишется в лог,
+    при QUERY_BUDGET_RAISE (включается в тестах) — исключение. Запросы,
+    выполненные при отдаче потокового ответа, не учитываются. Работает
+    и под WSGI, и под ASGI без переходов между потоками.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.query_stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.check_budget(request, stats, response)
+
+    async def __acall__(self, request):
+        stats = request.query_stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.check_budget(request, stats, response)
+
+    def check_budget(self, request, stats, response):
+        stats.endpoint = get_endpoint(request)
+        if not (settings.DEBUG or settings.QUERY_BUDGET_RAISE or _logs):
+            return response
+
+        for log in _logs:
+            log[stats.endpoint].append(stats)
+        response['X-Query-Count'] = stats.count
+        response['X-Query-Time'] = f'{stats.time * 1000:.1f}'
+
+        budget = get_budget(stats.endpoint)
+        if budget is not None and stats.count > budget:
+            message = f'Query budget {budget} exceeded. {stats.describe()}'
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
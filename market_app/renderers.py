@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Диапазон модуля float, в котором orjson и json пишут число одинаково
+# (без экспоненты): json переходит к 1e-05 и 1e+16, orjson — к 1e-5 и 1e16
+PLAIN_FLOAT_MIN = 1e-4
+PLAIN_FLOAT_MAX = 1e16
+
+
+def has_unsafe_floats(data):
+    """
+    Есть ли в значениях data число, которое orjson записал бы не так, как
+    JSONRenderer: NaN и бесконечность (orjson пишет null, строгий
+    JSONRenderer отклоняет) или float вне диапазона обычной записи.
+    Decimal проверяется так же: JSONEncoder DRF переводит его во float.
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, (float, Decimal)):
+            value = abs(float(value))
+            # NaN не проходит ни одно сравнение
+            if value and not PLAIN_FLOAT_MIN <= value < PLAIN_FLOAT_MAX:
+                return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson. Типы, которых orjson не знает или пишет
+    иначе (Decimal, дата и время, ленивые строки), передаются
+    JSONEncoder DRF, поэтому вывод совпадает с JSONRenderer байт в байт.
+    Отступы, ensure_ascii и числа, которые orjson пишет иначе
+    (has_unsafe_floats), обрабатывает стандартный JSONRenderer.
+    """
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (self.get_indent(accepted_media_type, renderer_context)
+                is not None or self.ensure_ascii
+                or has_unsafe_floats(data)):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=self.options)
+        except orjson.JSONEncodeError:
+            # Например, целые длиннее 64 бит
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк, которые
+        # нельзя оставлять в JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack по Accept: application/msgpack или ?format=msgpack.
+    Значения, которых нет в MessagePack, приводятся так же, как в JSON.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default,
+                             use_bin_type=True)
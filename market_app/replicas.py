@@ -0,0 +1,140 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from market_app.querybudget import get_endpoint
+
+
+logger = logging.getLogger(__name__)
+
+# Читать ли текущий запрос из реплики
+_read_replica = ContextVar('read_replica', default=False)
+# Время (time.monotonic), до которого реплика считается недоступной
+_unavailable_until = {}
+
+
+def get_replica():
+    """
+    Алиас реплики из REPLICA_DATABASE или None, если реплика не задана
+    либо к ней не удалось подключиться. После ошибки подключения
+    реплика REPLICA_RETRY_SECONDS не используется.
+    """
+    alias = settings.REPLICA_DATABASE
+    if alias is None or _unavailable_until.get(alias, 0) > time.monotonic():
+        return None
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        logger.warning('Replica %s is unavailable, reading from primary',
+                       alias, exc_info=True)
+        _unavailable_until[alias] = (time.monotonic()
+                                     + settings.REPLICA_RETRY_SECONDS)
+        return None
+    return alias
+
+
+def is_sticky(request):
+    """
+    Клиент недавно что-то изменил, и его чтения ещё идут в основную базу.
+    """
+    value = request.COOKIES.get(settings.REPLICA_STICKY_COOKIE)
+    try:
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
+
+
+def reads_from_replica():
+    """
+    Чтения текущего запроса идут в реплику, а не в основную базу.
+    """
+    return _read_replica.get() and get_replica() is not None
+
+
+class ReplicaRouter:
+    """
+    Чтения эндпоинтов, выбранных ReplicaMiddleware, идут в реплику,
+    остальные чтения и все записи — в основную базу. Доступность реплики
+    проверяется здесь, в потоке, где выполняется запрос к базе.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_replica.get():
+            return get_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Без явного алиаса Django записал бы объект туда, откуда он
+        # прочитан, то есть в реплику
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        databases = {DEFAULT_DB_ALIAS, settings.REPLICA_DATABASE}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтения безопасных эндпоинтов (REPLICA_READ_ENDPOINTS)
+    в реплику. После успешного изменяющего запроса ставит cookie, и чтения
+    этого клиента REPLICA_STICKY_SECONDS идут в основную базу, чтобы он
+    видел свои изменения несмотря на отставание реплики.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Синхронный process_view Django вызвал бы через sync_to_async
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+        return self.stick_to_primary(request, response)
+
+    async def __acall__(self, request):
+        token = _read_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_replica.reset(token)
+        return self.stick_to_primary(request, response)
+
+    def stick_to_primary(self, request, response):
+        if (settings.REPLICA_DATABASE and request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE,
+                                f'{time.time() + seconds:.0f}',
+                                max_age=seconds, httponly=True,
+                                samesite='Lax')
+        return response
+
+    def route_reads(self, request):
+        if (settings.REPLICA_DATABASE and request.method in SAFE_METHODS
+                and get_endpoint(request) in settings.REPLICA_READ_ENDPOINTS
+                and not is_sticky(request)):
+            _read_replica.set(True)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.route_reads(request)
+
+    async def aprocess_view(self, request, view_func, view_args,
+                            view_kwargs):
+        self.route_reads(request)
@@ -1,27 +1,50 @@
 from rest_framework import serializers
 
-from market_app.models import Advertisement, Review
+from market_app.images import ImageVariantsField
+from market_app.metrics import TimedListSerializer, TimedSerializerMixin
+from market_app.models import LATEST_REVIEWS, Advertisement, Review
+from market_app.sparse import SparseFieldsMixin
 
 
-class AdvertisementSerializer(serializers.ModelSerializer):
+class AdvertisementSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                              serializers.ModelSerializer):
     review = serializers.SerializerMethodField()
-    review_count = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(read_only=True)
+    image_variants = ImageVariantsField()
+    sparse_prefetch_fields = ('review',)
+    NO_REVIEWS = 'Nobody wants to comment it!'
 
     class Meta:
         model = Advertisement
-        fields = '__all__'
+        exclude = ('search_vector', 'last_reviewed_at', 'updated_at')
+        list_serializer_class = TimedListSerializer
 
     def get_review(self, obj):
-        if obj.review_set.all():
-            review_list = [review.text for review in obj.review_set.all()]
+        # Последние отзывы подгружает with_reviews(), без него — запрос
+        reviews = getattr(obj, 'latest_reviews', None)
+        if reviews is None:
+            reviews = obj.review_set.order_by(
+                '-created_at', '-id')[:LATEST_REVIEWS]
+        review_list = [review.text for review in reviews]
+        if review_list:
             return review_list
-        return 'Nobody wants to comment it!'
+        return self.NO_REVIEWS
 
-    def get_review_count(self, obj):
-        return obj.review_set.count()
 
+class AdvertisementBulkSerializer(serializers.ModelSerializer):
+    """
+    Поля объявления для пакетных операций: автор берётся из запроса,
+    поэтому проверка элемента не обращается к базе.
+    """
 
-class ReviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Advertisement
+        fields = ('title', 'price', 'description')
+
+
+class ReviewSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                       serializers.ModelSerializer):
     class Meta:
         model = Review
-        fields = '__all__'
+        exclude = ('updated_at',)
+        list_serializer_class = TimedListSerializer
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from market_app.cache import invalidate_responses
+from market_app.images import (delete_variants, needs_processing,
+                               schedule_image_processing)
+from market_app.models import Advertisement, Review
+
+
+# Фикстуры (raw=True) и bulk_create сигналы не обновляют:
+# после них нужно выполнить manage.py refresh_review_stats
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+
+    previous_ad_id = getattr(instance, '_loaded_ad_id', None)
+    if created:
+        Advertisement.objects.filter(
+            pk=instance.ad_id).review_added(instance.created_at)
+    elif previous_ad_id is not None and previous_ad_id != instance.ad_id:
+        Advertisement.objects.filter(pk=previous_ad_id).review_removed()
+        Advertisement.objects.filter(pk=instance.ad_id).refresh_review_stats()
+    else:
+        Advertisement.objects.filter(pk=instance.ad_id).touch()
+    instance._loaded_ad_id = instance.ad_id
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # При каскадном удалении самого объявления этот UPDATE лишний,
+    # но безвредный: строка объявления удаляется следом
+    Advertisement.objects.filter(pk=instance.ad_id).review_removed()
+
+
+@receiver(post_save, sender=Advertisement)
+@receiver(post_delete, sender=Advertisement)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def market_changed(sender, **kwargs):
+    invalidate_responses()
+
+
+def advertisement_image_processed(pk):
+    Advertisement.objects.filter(pk=pk).touch()
+    invalidate_responses()
+
+
+@receiver(post_save, sender=Advertisement)
+def advertisement_image_changed(sender, instance, raw, **kwargs):
+    if not raw and needs_processing(instance):
+        schedule_image_processing(Advertisement, instance.pk,
+                                  advertisement_image_processed)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_image_changed(sender, instance, raw, **kwargs):
+    if not raw and needs_processing(instance):
+        schedule_image_processing(sender, instance.pk)
+
+
+@receiver(post_save, sender=Advertisement)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def image_replaced(sender, instance, raw, **kwargs):
+    if raw or 'image' in instance.get_deferred_fields():
+        return
+
+    previous = getattr(instance, '_loaded_image', None)
+    current = instance.image.name or None
+    if previous and previous != current:
+        storage = instance.image.storage
+        transaction.on_commit(lambda: storage.delete(previous))
+    instance._loaded_image = current
+
+
+@receiver(post_delete, sender=Advertisement)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def image_owner_deleted(sender, instance, **kwargs):
+    storage = sender._meta.get_field('image').storage
+    name = instance.__dict__.get('image')
+    variants = instance.__dict__.get('image_variants')
+
+    def release():
+        storage.delete(name)
+        delete_variants(storage, variants)
+
+    transaction.on_commit(release)
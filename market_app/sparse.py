@@ -0,0 +1,82 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+
+
+def split_names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def get_sparse_fields(request, names):
+    """
+    Поля ответа по параметрам ?fields=title,price и ?omit=description
+    или None, если выводятся все. Неизвестные имена пропускаются, id
+    выводится всегда. Запросы на изменение не ограничиваются: поля
+    сериализатора нужны и для проверки входных данных.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    if 'fields' not in params and 'omit' not in params:
+        return None
+
+    names = set(names)
+    selected = set(names)
+    if 'fields' in params:
+        selected &= split_names(params['fields'])
+    if 'omit' in params:
+        selected -= split_names(params['omit'])
+    selected |= {'id'} & names
+    return None if selected == names else selected
+
+
+class SparseFieldsMixin:
+    """
+    Сериализатор выводит только поля из get_sparse_fields() и умеет
+    сузить под них queryset: загружаются только нужные столбцы,
+    а prefetch выполняется, только если запрошено поле из
+    sparse_prefetch_fields.
+    """
+    sparse_prefetch_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = get_sparse_fields(self.context.get('request'),
+                                     self.fields)
+        if selected is not None:
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+
+    @classmethod
+    def sparse_queryset(cls, queryset, request):
+        fields = cls().fields
+        selected = get_sparse_fields(request, fields)
+        if selected is None:
+            return queryset
+
+        model = queryset.model
+        # Поля сортировки нужны курсорной пагинации для позиции
+        columns = {model._meta.pk.name}
+        columns.update(name.lstrip('-') for name in model._meta.ordering)
+        for name in selected:
+            try:
+                field = model._meta.get_field(fields[name].source)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete:
+                columns.add(field.name)
+
+        queryset = queryset.only(*columns)
+        if not selected & set(cls.sparse_prefetch_fields):
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+
+class SparseQuerysetMixin:
+    """
+    Для представлений: queryset сужается под ?fields= и ?omit=
+    сериализатора (см. SparseFieldsMixin).
+    """
+
+    def get_queryset(self):
+        return self.get_serializer_class().sparse_queryset(
+            super().get_queryset(), self.request)
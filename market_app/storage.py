@@ -0,0 +1,98 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.db.models.functions import Now
+
+
+# Путь, уже сохранённый ContentAddressedStorage: <каталог>/ab/cd/<хэш>
+HASHED_NAME = re.compile(r'^(?:(?P<directory>.*)/)?(?P<prefix>[0-9a-f]{2}/'
+                         r'[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})[^/]*$')
+
+
+def upload_directory(name):
+    """
+    Каталог, в который сохраняется файл name. Для уже сохранённого
+    по хэшу имени это исходный каталог без сегментов ab/cd, поэтому
+    повторное сохранение не вкладывает их друг в друга.
+    """
+    match = HASHED_NAME.match(name)
+    if match and (match['digest'][:2] + '/' + match['digest'][2:4]
+                  == match['prefix']):
+        return match['directory'] or ''
+    return posixpath.dirname(name)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором файл лежит по пути из SHA-256 его содержимого:
+    <каталог upload_to>/ab/cd/<хэш>.<расширение>. Одинаковые загрузки
+    хранятся один раз, а число ссылок на каждый файл ведётся в StoredFile:
+    save() берёт ссылку, delete() отпускает её. Файлы без ссылок и файлы
+    без StoredFile (после отката транзакции) удаляет
+    manage.py collect_media_garbage.
+    """
+    hash_chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # Совпадение имён означает совпадение содержимого
+        return name
+
+    def _save(self, name, content):
+        digest = self.hash_content(content)
+        directory = upload_directory(name)
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest[2:4],
+                              digest + extension)
+
+        if self.exists(name):
+            # Свежее время изменения не даёт сборке мусора удалить файл,
+            # пока не завершена транзакция, которая берёт на него ссылку
+            os.utime(self.path(name))
+        else:
+            # Запись во временный файл и атомарная замена: параллельная
+            # загрузка того же содержимого не увидит недописанный файл
+            temporary = super()._save(f'{name}.{uuid.uuid4().hex}.part',
+                                      content)
+            os.replace(self.path(temporary), self.path(name))
+        # Ссылка берётся после записи: если транзакция откатится, файл
+        # без StoredFile найдёт и удалит manage.py collect_media_garbage
+        self.acquire(name, content.size)
+        return name
+
+    def hash_content(self, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks(self.hash_chunk_size):
+            sha256.update(chunk.encode() if isinstance(chunk, str) else chunk)
+        content.seek(0)
+        return sha256.hexdigest()
+
+    def acquire(self, name, size):
+        StoredFile = apps.get_model('market_app', 'StoredFile')
+        while True:
+            StoredFile.objects.get_or_create(name=name,
+                                             defaults={'size': size})
+            # Запись могла удалить сборка мусора между двумя запросами
+            if StoredFile.objects.filter(name=name).update(
+                    ref_count=F('ref_count') + 1, updated_at=Now()):
+                return
+
+    def delete(self, name):
+        if not name:
+            return
+        StoredFile = apps.get_model('market_app', 'StoredFile')
+        released = StoredFile.objects.filter(
+            name=name, ref_count__gt=0
+        ).update(ref_count=F('ref_count') - 1, updated_at=Now())
+        if not released and not StoredFile.objects.filter(name=name).exists():
+            # Файл сохранён до перехода на это хранилище и ни с кем
+            # не разделяется
+            self.purge(name)
+
+    def purge(self, name):
+        super().delete(name)
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from market_app.querybudget import get_budget, record_queries
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """
+    Тестовый раннер, при котором запрос к API сверх бюджета своего
+    эндпоинта (QUERY_BUDGETS) роняет тест.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_RAISE = True
+
+
+class QueryBudgetAssertionsMixin:
+
+    @contextmanager
+    def assertEndpointQueries(self, endpoint, max_queries=None):
+        """
+        Проверяет, что каждый вызов endpoint внутри блока выполнил не больше
+        max_queries запросов (по умолчанию — бюджет эндпоинта) и ни одного
+        повторяющегося.
+        """
+        if max_queries is None:
+            max_queries = get_budget(endpoint)
+        with record_queries() as log:
+            yield log
+
+        self.assertTrue(log[endpoint], f'{endpoint} was not called')
+        for stats in log[endpoint]:
+            self.assertLessEqual(stats.count, max_queries, stats.describe())
+            self.assertFalse(stats.duplicates, stats.describe())
@@ -1,13 +1,46 @@
-from django.db import connection
+import csv
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import (OperationalError, connection, connections,
+                       transaction)
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy
+import msgpack
+from PIL import Image
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from market_app.models import Advertisement, Review
+from market_app import benchmark
+from market_app import cache as response_cache
+from market_app.metrics import MetricsMiddleware
+from market_app.models import Advertisement, Review, StoredFile
+from market_app.querybudget import QueryBudgetExceeded, QueryBudgetMiddleware
+from market_app.replicas import ReplicaMiddleware
+from market_app.renderers import FastJSONRenderer, MessagePackRenderer
+from market_app.testing import QueryBudgetAssertionsMixin
+from market_app.views import AdsListAPIView, AdvertisementViewSet
 from users_app.models import User
 
 
-class MarketTestCase(APITestCase):
+class MarketTestCase(QueryBudgetAssertionsMixin, APITestCase):
+    databases = {'default', 'replica'}
 
     def setUp(self):
         """
@@ -190,6 +223,7 @@ class MarketTestCase(APITestCase):
             'description': 'test 4',
             'id': 1,
             'image': None,
+            'image_variants': None,
             'price': '230.00',
             'review': ['test review'],
             'review_count': 1,
@@ -272,6 +306,7 @@ class MarketTestCase(APITestCase):
             'description': 'test adv',
             'id': 1,
             'image': None,
+            'image_variants': None,
             'price': '300.00',
             'review': ['test review'],
             'review_count': 1,
@@ -356,3 +391,1703 @@ class MarketTestCase(APITestCase):
             response.status_code,
             status.HTTP_403_FORBIDDEN
         )
+
+    def test_adv_list_query_count(self):
+        """
+        Количество запросов списка объявлений не зависит от размера страницы.
+        """
+
+        for i in range(3):
+            adv = Advertisement.objects.create(
+                author=self.another_user,
+                title=f"bulk {i}",
+                price="100",
+                description="bulk adv"
+            )
+            Review.objects.create(author=self.user, ad=adv, text=f"r {i}")
+
+        # COUNT для пагинации, объявления, отзывы одним prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('market_app:ads-list'))
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+
+        for item in response.json()['results']:
+            self.assertEqual(
+                item['review_count'],
+                Review.objects.filter(ad_id=item['id']).count()
+            )
+
+    def test_my_ads_query_count(self):
+        """
+        Список своих объявлений также загружается фиксированным числом
+        запросов.
+        """
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('market_app:my_ads'))
+
+        self.assertEqual(
+            response.json()['results'][0]['review'],
+            ['test review']
+        )
+
+    def test_my_ads_anonymous(self):
+        """
+        Анонимный запрос к списку своих объявлений отклоняется, а не
+        возвращает объявления без автора.
+        """
+
+        Advertisement.objects.filter(pk=self.another_adv.pk).update(
+            author=None)
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(reverse('market_app:my_ads'))
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+
+    def test_adv_cursor_pagination(self):
+        """
+        Курсорная пагинация проходит все объявления по порядку
+        (-created_at, -id) без пропусков и повторов.
+        """
+
+        for i in range(7):
+            Advertisement.objects.create(
+                author=self.another_user,
+                title=f"cursor {i}",
+                price="100",
+                description="cursor adv"
+            )
+
+        expected = list(Advertisement.objects.values_list('id', flat=True))
+        url = reverse('market_app:ads-list') + '?pagination=cursor'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.json())
+            pages.append(response.json())
+            url = response.json()['next']
+
+        self.assertEqual(
+            [item['id'] for page in pages for item in page['results']],
+            expected
+        )
+        self.assertIsNone(pages[0]['previous'])
+
+        # Ссылка назад с последней страницы возвращает предпоследнюю
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(
+            [item['id'] for item in response.json()['results']],
+            [item['id'] for item in pages[-2]['results']]
+        )
+
+    def test_adv_cursor_pagination_query_count(self):
+        """
+        Курсорная страница не выполняет COUNT(*).
+        """
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('market_app:ads-list'), {'pagination': 'cursor'}
+            )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+
+    def test_invalid_cursor(self):
+        """
+        Некорректный курсор возвращает 404.
+        """
+
+        response = self.client.get(
+            reverse('market_app:reviews-list'), {'cursor': 'broken'}
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_adv_page_number_pagination(self):
+        """
+        Клиенты постраничной пагинации получают прежний формат ответа.
+        """
+
+        response = self.client.get(reverse('market_app:ads-list'))
+
+        self.assertEqual(
+            response.json()['count'],
+            2
+        )
+
+    def test_adv_full_text_search(self):
+        """
+        Поиск идёт и по описанию, совпадение в заголовке выше по
+        релевантности, словоформы учитываются.
+        """
+
+        in_description = Advertisement.objects.create(
+            author=self.user,
+            title="Продаю",
+            price="5000",
+            description="Горный велосипед, почти новый"
+        )
+        in_title = Advertisement.objects.create(
+            author=self.user,
+            title="Велосипед детский",
+            price="3000",
+            description="Катались одно лето"
+        )
+        Advertisement.objects.create(
+            author=self.user,
+            title="Самокат",
+            price="1000",
+            description="Без царапин"
+        )
+
+        response = self.client.get(
+            reverse('market_app:ads-list'), {'search': 'велосипеды'}
+        )
+
+        self.assertEqual(
+            [item['id'] for item in response.json()['results']],
+            [in_title.pk, in_description.pk]
+        )
+        self.assertNotIn('search_vector', response.json()['results'][0])
+
+    def test_adv_search_vector_follows_updates(self):
+        """
+        search_vector пересчитывается при изменении заголовка.
+        """
+
+        self.adv.title = "Гитара"
+        self.adv.save()
+
+        response = self.client.get(
+            reverse('market_app:ads-list'), {'search': 'гитара'}
+        )
+
+        self.assertEqual(
+            [item['id'] for item in response.json()['results']],
+            [self.adv.pk]
+        )
+
+    def test_adv_suggest(self):
+        """
+        Подсказки находят заголовки по началу слова и с опечаткой,
+        повторный запрос отдаётся из кэша.
+        """
+
+        caches['suggest'].clear()
+        for title in ("Велосипед горный", "Велосипед детский", "Самокат"):
+            Advertisement.objects.create(
+                author=self.user,
+                title=title,
+                price="1000",
+                description="suggest"
+            )
+
+        response = self.client.get(
+            reverse('market_app:ads-suggest'), {'q': '  Вело '}
+        )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertEqual(
+            sorted(response.json()['results']),
+            ["Велосипед горный", "Велосипед детский"]
+        )
+
+        response = self.client.get(
+            reverse('market_app:ads-suggest'), {'q': 'велосипд'}
+        )
+        self.assertEqual(
+            len(response.json()['results']),
+            2
+        )
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('market_app:ads-suggest'), {'q': 'ВЕЛОСИПД'}
+            )
+        self.assertEqual(
+            len(response.json()['results']),
+            2
+        )
+
+    def test_adv_suggest_short_query(self):
+        """
+        Слишком короткий запрос не обращается к базе.
+        """
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('market_app:ads-suggest'), {'q': 'в'}
+            )
+
+        self.assertEqual(
+            response.json(),
+            {'results': []}
+        )
+
+    def test_review_stats_follow_api_writes(self):
+        """
+        review_count и last_reviewed_at обновляются при создании
+        и удалении отзыва через API.
+        """
+
+        response = self.client.post(
+            reverse('market_app:reviews-list'),
+            data={'text': 'second review', 'ad': self.adv.pk}
+        )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED
+        )
+
+        self.adv.refresh_from_db()
+        second = Review.objects.get(pk=response.json()['id'])
+        self.assertEqual(self.adv.review_count, 2)
+        self.assertEqual(self.adv.last_reviewed_at, second.created_at)
+
+        response = self.client.delete(
+            reverse('market_app:reviews-detail', kwargs={'pk': second.pk})
+        )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_204_NO_CONTENT
+        )
+
+        self.adv.refresh_from_db()
+        self.assertEqual(self.adv.review_count, 1)
+        self.assertEqual(self.adv.last_reviewed_at, self.review.created_at)
+
+    def test_review_stats_follow_cascade_and_move(self):
+        """
+        Счётчики учитывают каскадное удаление автора отзыва и перенос
+        отзыва на другое объявление.
+        """
+
+        Review.objects.create(author=self.another_user, ad=self.adv,
+                              text="cascade")
+        self.another_user.delete()
+        self.adv.refresh_from_db()
+        self.assertEqual(self.adv.review_count, 1)
+
+        other_adv = Advertisement.objects.create(
+            author=self.user,
+            title="other",
+            price="10",
+            description="other"
+        )
+        review = Review.objects.get(pk=self.review.pk)
+        review.ad = other_adv
+        review.save()
+
+        self.adv.refresh_from_db()
+        other_adv.refresh_from_db()
+        self.assertEqual(self.adv.review_count, 0)
+        self.assertIsNone(self.adv.last_reviewed_at)
+        self.assertEqual(other_adv.review_count, 1)
+
+    def test_adv_save_keeps_review_stats(self):
+        """
+        Сохранение ранее загруженного объявления не затирает счётчик,
+        изменённый после загрузки.
+        """
+
+        adv = Advertisement.objects.get(pk=self.adv.pk)
+        Review.objects.create(author=self.user, ad=self.adv, text="new")
+        adv.title = "renamed"
+        adv.save()
+
+        adv.refresh_from_db()
+        self.assertEqual(adv.review_count, 2)
+
+    def test_refresh_review_stats_command(self):
+        """
+        Команда refresh_review_stats исправляет рассинхронизированные
+        счётчики, например после bulk_create.
+        """
+
+        Review.objects.bulk_create([
+            Review(author=self.user, ad=self.another_adv, text="bulk 1"),
+            Review(author=self.user, ad=self.another_adv, text="bulk 2"),
+        ])
+        Advertisement.objects.filter(pk=self.adv.pk).update(review_count=7)
+
+        out = StringIO()
+        call_command('refresh_review_stats', stdout=out)
+
+        self.adv.refresh_from_db()
+        self.another_adv.refresh_from_db()
+        self.assertEqual(self.adv.review_count, 1)
+        self.assertEqual(self.another_adv.review_count, 2)
+        self.assertIsNotNone(self.another_adv.last_reviewed_at)
+        self.assertIn('исправлено: 2', out.getvalue())
+
+    def test_adv_list_response_cache(self):
+        """
+        Повторный запрос списка отдаётся из кэша без обращения к базе,
+        новый отзыв сбрасывает кэш.
+        """
+
+        url = reverse('market_app:ads-list')
+        stats = response_cache.get_stats()
+
+        first = self.client.get(url, {'page': 1})
+        with self.assertNumQueries(0):
+            second = self.client.get(url, {'page': 1})
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(
+            response_cache.get_stats(),
+            {'hits': stats['hits'] + 1, 'misses': stats['misses'] + 1}
+        )
+
+        Review.objects.create(author=self.user, ad=self.adv, text="fresh")
+        third = self.client.get(url, {'page': 1})
+
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertIn(
+            'fresh',
+            [item for item in third.json()['results']
+             if item['id'] == self.adv.pk][0]['review']
+        )
+
+    def test_response_cache_shared_generation(self):
+        """
+        Поколение хранится в общем кэше: сдвиг в другом процессе
+        сбрасывает ответы и ETag, закэшированные в памяти этого.
+        """
+
+        url = reverse('market_app:ads-list')
+        shared = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                  'LOCATION': 'shared'}
+        with self.settings(CACHES=dict(settings.CACHES, shared=shared),
+                           GENERATION_CACHE_ALIAS='shared'):
+            first = self.client.get(url)
+            self.assertEqual(
+                self.client.get(url)['X-Cache'],
+                'HIT'
+            )
+            self.assertIsNotNone(
+                caches['shared'].get(response_cache.GENERATION_KEY))
+
+            # Запись, обработанная другим воркером
+            Advertisement.objects.filter(pk=self.adv.pk).update(
+                title='changed')
+            caches['shared'].incr(response_cache.GENERATION_KEY)
+
+            response = self.client.get(url,
+                                       HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(
+                (response.status_code, response['X-Cache']),
+                (status.HTTP_200_OK, 'MISS')
+            )
+            self.assertIn(
+                'changed',
+                [item['title'] for item in response.json()['results']]
+            )
+
+    def test_adv_retrieve_response_cache_file_backend(self):
+        """
+        Кэш ответов работает с файловым бэкендом.
+        """
+
+        with tempfile.TemporaryDirectory() as location:
+            with self.settings(CACHES={'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}):
+                url = reverse('market_app:ads-detail',
+                              kwargs={'pk': self.adv.pk})
+                self.client.get(url)
+                response = self.client.get(url)
+                self.assertEqual(response['X-Cache'], 'HIT')
+
+                self.client.patch(url, data={'title': 'changed'})
+                response = self.client.get(url)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertEqual(response.json()['title'], 'changed')
+
+    def test_adv_retrieve_conditional_get(self):
+        """
+        Повторный запрос с If-None-Match или If-Modified-Since получает
+        304 за один запрос версии, новый отзыв меняет ETag.
+        """
+
+        url = reverse('market_app:ads-detail', kwargs={'pk': self.adv.pk})
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            not_modified.status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        not_modified = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(
+            not_modified.status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        Review.objects.create(author=self.user, ad=self.adv, text="new")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_review_list_conditional_get(self):
+        """
+        Список отзывов отдаёт ETag и 304 без обращения к базе, пока
+        данные не менялись.
+        """
+
+        url = reverse('market_app:reviews-list')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        self.review.text = "edited"
+        self.review.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+
+    def make_image(self, size=(1000, 800)):
+        """
+        JPEG с EXIF-метаданными для проверки обработки изображений.
+        """
+
+        image = Image.new('RGB', size, (200, 30, 30))
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+
+    def test_adv_image_variants(self):
+        """
+        После загрузки изображения строятся JPEG и WebP варианты,
+        оригинал перекодируется без метаданных.
+        """
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    reverse('market_app:ads-detail',
+                            kwargs={'pk': self.adv.pk}),
+                    data={'image': self.make_image()},
+                    format='multipart'
+                )
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK
+            )
+
+            self.adv.refresh_from_db()
+            self.assertEqual(
+                sorted(self.adv.image_variants['webp']),
+                ['160', '320', '640']
+            )
+            with self.adv.image.open('rb') as file:
+                self.assertEqual(len(Image.open(file).getexif()), 0)
+            name = self.adv.image_variants['webp']['320']
+            with default_storage.open(name) as file:
+                variant = Image.open(file)
+                self.assertEqual((variant.format, variant.width),
+                                 ('WEBP', 320))
+
+            response = self.client.get(
+                reverse('market_app:ads-detail', kwargs={'pk': self.adv.pk})
+            )
+            srcset = response.json()['image_variants']
+            self.assertIn('320w', srcset['webp'])
+            self.assertTrue(srcset['jpeg'].startswith('http://testserver/'))
+
+    def test_adv_image_other_formats_reencoded(self):
+        """
+        Снимки MPO с телефонов и форматы, в которых оригинал не хранится
+        (TIFF), тоже перекодируются без метаданных.
+        """
+
+        def make_file(name, image_format, **options):
+            exif = Image.Exif()
+            exif[0x010F] = 'Camera maker'
+            buffer = BytesIO()
+            Image.new('RGB', (200, 100), (200, 30, 30)).save(
+                buffer, format=image_format, exif=exif, **options)
+            return SimpleUploadedFile(name, buffer.getvalue())
+
+        mpo = make_file('photo.jpg', 'MPO', save_all=True,
+                        append_images=[Image.new('RGB', (200, 100))])
+        self.assertEqual(Image.open(mpo).format, 'MPO')
+        mpo.seek(0)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(
+                    reverse('market_app:ads-detail',
+                            kwargs={'pk': self.adv.pk}),
+                    data={'image': mpo},
+                    format='multipart'
+                )
+            name = default_storage.save('images/scan.tiff',
+                                        make_file('scan.tiff', 'TIFF'))
+            Advertisement.objects.filter(pk=self.another_adv.pk).update(
+                image=name)
+            call_command('process_images', stdout=StringIO())
+
+            for adv, image_format in ((self.adv, 'JPEG'),
+                                      (self.another_adv, 'PNG')):
+                adv.refresh_from_db()
+                with adv.image.open('rb') as file:
+                    image = Image.open(file)
+                    self.assertEqual(
+                        (image.format, len(image.getexif())),
+                        (image_format, 0)
+                    )
+            self.assertTrue(self.another_adv.image.name.endswith('.png'))
+
+    def test_process_images_command(self):
+        """
+        Команда process_images обрабатывает изображения, пропущенные
+        фоновым пулом.
+        """
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            name = default_storage.save('images/raw.jpg',
+                                        self.make_image((200, 100)))
+            Advertisement.objects.filter(pk=self.adv.pk).update(image=name)
+
+            call_command('process_images', stdout=StringIO())
+
+            self.adv.refresh_from_db()
+            self.assertEqual(
+                sorted(self.adv.image_variants['jpeg']),
+                ['160', '200']
+            )
+
+    def test_content_addressed_storage(self):
+        """
+        Одинаковые загрузки хранятся одним файлом, файл удаляется
+        сборкой мусора только когда на него не осталось ссылок.
+        """
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            content = self.make_image((50, 50)).read()
+            first = default_storage.save('images/a.jpg',
+                                         ContentFile(content))
+            second = default_storage.save('images/b.JPG',
+                                          ContentFile(content))
+
+            self.assertEqual(first, second)
+            self.assertRegex(first, r'^images/../../[0-9a-f]{64}\.jpg$')
+            self.assertEqual(
+                StoredFile.objects.get(name=first).ref_count,
+                2
+            )
+
+            Advertisement.objects.filter(pk=self.adv.pk).update(image=first)
+            default_storage.delete(first)
+            default_storage.delete(first)
+            StoredFile.objects.update(updated_at=now() - timedelta(days=2))
+
+            # Счётчик обнулён, но объявление всё ещё ссылается на файл
+            call_command('collect_media_garbage', stdout=StringIO())
+            self.assertTrue(default_storage.exists(first))
+
+            Advertisement.objects.filter(pk=self.adv.pk).update(image='')
+            call_command('collect_media_garbage', stdout=StringIO())
+            self.assertFalse(default_storage.exists(first))
+            self.assertFalse(StoredFile.objects.exists())
+
+    def test_collect_media_garbage_rolled_back_upload(self):
+        """
+        Файл, загруженный в откатившейся транзакции, остаётся без
+        StoredFile и удаляется сборкой мусора после срока ожидания.
+        """
+
+        class Rollback(Exception):
+            pass
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            with self.assertRaises(Rollback), transaction.atomic():
+                name = default_storage.save(
+                    'images/a.jpg', ContentFile(self.make_image().read()))
+                raise Rollback
+            self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+            call_command('collect_media_garbage', stdout=StringIO())
+            self.assertTrue(default_storage.exists(name))
+
+            call_command('collect_media_garbage', '--grace-hours', '-1',
+                         stdout=StringIO())
+            self.assertFalse(default_storage.exists(name))
+
+    def test_content_addressed_storage_resave(self):
+        """
+        Повторное сохранение под уже хэшированным именем не вкладывает
+        каталоги ab/cd друг в друга, варианты лежат в каталоге ширины.
+        """
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0):
+            first = default_storage.save(
+                'images/a.jpg', ContentFile(self.make_image().read()))
+            second = default_storage.save(
+                first, ContentFile(self.make_image((90, 90)).read()))
+            self.assertRegex(second, r'^images/../../[0-9a-f]{64}\.jpg$')
+            self.assertEqual(
+                default_storage.save(second, default_storage.open(second)),
+                second
+            )
+
+            Advertisement.objects.filter(pk=self.adv.pk).update(image=first)
+            call_command('process_images', stdout=StringIO())
+            self.adv.refresh_from_db()
+            self.assertRegex(self.adv.image.name,
+                             r'^images/../../[0-9a-f]{64}\.jpg$')
+            self.assertRegex(
+                self.adv.image_variants['webp']['160'],
+                r'^images/variants/160w/../../[0-9a-f]{64}\.webp$'
+            )
+
+    def test_adv_image_reference_released(self):
+        """
+        При замене изображения и удалении объявления ссылки на файлы
+        отпускаются.
+        """
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0):
+            url = reverse('market_app:ads-detail', kwargs={'pk': self.adv.pk})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(url, data={'image': self.make_image()},
+                                  format='multipart')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(url,
+                                  data={'image': self.make_image((90, 90))},
+                                  format='multipart')
+            self.adv.refresh_from_db()
+            referenced = {self.adv.image.name}
+            for key in ('jpeg', 'webp'):
+                referenced.update(self.adv.image_variants[key].values())
+
+            self.assertEqual(
+                set(StoredFile.objects.filter(ref_count__gt=0)
+                    .values_list('name', flat=True)),
+                referenced
+            )
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(url)
+            self.assertFalse(
+                StoredFile.objects.filter(ref_count__gt=0).exists()
+            )
+
+    def test_adv_bulk_create(self):
+        """
+        Пакетное создание объявлений: ответ по каждому элементу, число
+        запросов не зависит от размера пакета.
+        """
+
+        url = reverse('market_app:ads-bulk')
+        for size in (2, 10):
+            items = [{'title': f'bulk {i}', 'price': '10',
+                      'description': 'bulk adv'} for i in range(size)]
+            # SAVEPOINT, INSERT всех объявлений, RELEASE
+            with self.assertNumQueries(3):
+                response = self.client.post(url, data=items, format='json')
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK
+            )
+
+        response = self.client.post(
+            url,
+            data=[{'title': 'ok', 'price': '10', 'description': 'ok'},
+                  {'title': 'no price'}],
+            format='json'
+        )
+        results = response.json()['results']
+
+        self.assertEqual(
+            [item['status'] for item in results],
+            [201, 400]
+        )
+        self.assertEqual(
+            Advertisement.objects.get(pk=results[0]['id']).author,
+            self.user
+        )
+        self.assertIn('price', results[1]['errors'])
+        self.assertTrue(
+            Advertisement.objects.get(pk=results[0]['id']).search_vector
+        )
+
+    def test_adv_bulk_update(self):
+        """
+        Пакетное изменение: чужие и несуществующие объявления не меняются.
+        """
+
+        invalid = Advertisement.objects.create(
+            author=self.user,
+            title="invalid",
+            price="100",
+            description="invalid adv"
+        )
+        response = self.client.patch(
+            reverse('market_app:ads-bulk'),
+            data=[{'id': self.adv.pk, 'price': '500'},
+                  {'id': self.another_adv.pk, 'price': '1'},
+                  {'id': 999, 'price': '1'},
+                  {'id': invalid.pk, 'price': 'abc'}],
+            format='json'
+        )
+
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            [200, 403, 404, 400]
+        )
+        self.adv.refresh_from_db()
+        self.another_adv.refresh_from_db()
+        self.assertEqual(
+            self.adv.price,
+            500
+        )
+        self.assertEqual(
+            self.another_adv.price,
+            3000
+        )
+        self.assertEqual(
+            self.adv.review_count,
+            1
+        )
+
+    def test_adv_bulk_update_repeated_id(self):
+        """
+        Повторяющийся id в пакетном изменении отклоняется во всех
+        элементах, объявление не меняется.
+        """
+
+        response = self.client.patch(
+            reverse('market_app:ads-bulk'),
+            data=[{'id': self.adv.pk, 'price': '500'},
+                  {'id': self.adv.pk, 'title': 'changed'}],
+            format='json'
+        )
+
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            [400, 400]
+        )
+        self.adv.refresh_from_db()
+        self.assertEqual(
+            (self.adv.price, self.adv.title),
+            (300, 'test')
+        )
+
+    def test_adv_bulk_delete(self):
+        """
+        Пакетное удаление: удаляются только свои объявления.
+        """
+
+        response = self.client.delete(
+            reverse('market_app:ads-bulk'),
+            data={'ids': [self.adv.pk, self.another_adv.pk, 999]},
+            format='json'
+        )
+
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            [204, 403, 404]
+        )
+        self.assertEqual(
+            list(Advertisement.objects.values_list('pk', flat=True)),
+            [self.another_adv.pk]
+        )
+
+    def test_adv_bulk_too_many_items(self):
+        """
+        Размер пакета ограничен.
+        """
+
+        response = self.client.post(
+            reverse('market_app:ads-bulk'),
+            data=[{}] * 101,
+            format='json'
+        )
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_adv_export_ndjson(self):
+        """
+        Потоковая выгрузка объявлений в NDJSON со счётчиком отзывов.
+        """
+
+        response = self.client.get(
+            reverse('market_app:ads-export',
+                    kwargs={'export_format': 'ndjson'}))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Type'],
+            'application/x-ndjson; charset=utf-8'
+        )
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            [(row['id'], row['review_count'], row['price']) for row in rows],
+            [(self.adv.pk, 1, '300.00'), (self.another_adv.pk, 0, '3000.00')]
+        )
+
+    def test_review_export_csv(self):
+        """
+        Потоковая выгрузка отзывов в CSV.
+        """
+
+        response = self.client.get(
+            reverse('market_app:reviews-export',
+                    kwargs={'export_format': 'csv'}))
+
+        rows = list(csv.DictReader(
+            b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(
+            [(row['id'], row['ad'], row['text']) for row in rows],
+            [(str(self.review.pk), str(self.adv.pk), 'test review')]
+        )
+
+    async def test_adv_export_asgi_streams(self):
+        """
+        Под ASGI выгрузка отдаётся асинхронным итератором, а не
+        собирается в список целиком.
+        """
+
+        token = RefreshToken.for_user(self.user).access_token
+        response = await self.async_client.get(
+            reverse('market_app:ads-export',
+                    kwargs={'export_format': 'csv'}),
+            headers={'Authorization': f'Bearer {token}'})
+
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk
+                            in response.streaming_content])
+        rows = list(csv.DictReader(content.decode().splitlines()))
+        self.assertEqual(
+            [row['title'] for row in rows],
+            ['test', 'test 2']
+        )
+
+    def test_export_market_command(self):
+        """
+        Команда выгрузки читает записи порциями и пишет их в stdout.
+        """
+
+        out = StringIO()
+        call_command('export_market', 'ads', '--format', 'csv',
+                     '--chunk-size', '1', stdout=out)
+
+        rows = list(csv.DictReader(out.getvalue().splitlines()))
+        self.assertEqual(
+            [row['title'] for row in rows],
+            ['test', 'test 2']
+        )
+
+    def test_import_ads_command(self):
+        """
+        Загрузка объявлений и отзывов через COPY: неверные строки
+        отклоняются, счётчики отзывов пересчитываются.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            ads_path = f'{directory}/ads.csv'
+            with open(ads_path, 'w', encoding='utf-8', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(('id', 'title', 'price', 'description',
+                                 'author_email'))
+                writer.writerow(('a1', 'Импорт', '150.5', 'с\tтабуляцией',
+                                 'TESTIK@test.ru'))
+                writer.writerow(('a2', 'без цены', '', 'x', 'test@test.ru'))
+                writer.writerow(('a3', 'чужой', '1', 'x', 'nobody@test.ru'))
+
+            reviews_path = f'{directory}/reviews.ndjson'
+            with open(reviews_path, 'w', encoding='utf-8') as file:
+                for ad in ('a1', 'a1', 'a2'):
+                    file.write(json.dumps({'ad': ad, 'text': 'ok',
+                                           'author_email': 'test@test.ru'})
+                               + '\n')
+                file.write('not json\n')
+
+            out, err = StringIO(), StringIO()
+            call_command('import_ads', ads_path, '--reviews', reviews_path,
+                         '--chunk-size', '2', stdout=out, stderr=err)
+
+        self.assertIn('Загружено объявлений: 1, отзывов: 2', out.getvalue())
+        self.assertEqual(
+            len(err.getvalue().splitlines()),
+            4
+        )
+        adv = Advertisement.objects.get(title='Импорт')
+        self.assertEqual(
+            (adv.author, adv.description, adv.review_count),
+            (self.another_user, 'с\tтабуляцией', 2)
+        )
+        self.assertEqual(
+            Advertisement.objects.filter(
+                pk=adv.pk, search_vector='импорт').count(),
+            1
+        )
+
+        # Последовательность сдвинута: обычное создание не конфликтует
+        self.assertGreater(
+            Advertisement.objects.create(
+                author=self.user, title='t', price=1, description='d').pk,
+            adv.pk
+        )
+
+    def test_async_adv_list_matches_sync(self):
+        """
+        Асинхронный список объявлений отдаёт то же, что синхронный,
+        в том числе при курсорной пагинации и поиске.
+        """
+
+        for query in ('', '?pagination=cursor', '?search=test'):
+            sync_response = self.client.get(
+                reverse('market_app:ads-list') + query)
+            async_response = self.client.get(
+                reverse('market_app:async-ads-list') + query)
+
+            self.assertEqual(
+                async_response.status_code,
+                status.HTTP_200_OK
+            )
+            self.assertEqual(
+                async_response.json()['results'],
+                sync_response.json()['results']
+            )
+
+    def test_async_adv_retrieve(self):
+        """
+        Асинхронное получение объявления требует JWT-токен.
+        """
+
+        url = reverse('market_app:async-ads-detail',
+                      kwargs={'pk': self.adv.pk})
+        client = APIClient()
+
+        self.assertEqual(
+            client.get(url).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+
+        token = RefreshToken.for_user(self.user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = client.get(url)
+
+        self.assertEqual(
+            response.json(),
+            self.client.get(reverse('market_app:ads-detail',
+                                    kwargs={'pk': self.adv.pk})).json()
+        )
+        self.assertEqual(
+            client.get(reverse('market_app:async-ads-detail',
+                               kwargs={'pk': 999})).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    async def test_async_review_list(self):
+        """
+        Асинхронный список отзывов через ASGI-клиент.
+        """
+
+        response = await self.async_client.get(
+            reverse('market_app:async-reviews-list'))
+
+        self.assertEqual(
+            response.json()['results'][0]['text'],
+            'test review'
+        )
+
+    def test_jwt_principal_without_user_query(self):
+        """
+        Аутентификация по JWT не читает пользователя из базы, пока его
+        роль и активность лежат в кэше.
+        """
+
+        client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        url = reverse('market_app:my_ads')
+
+        # Первый запрос заполняет кэш: роль и активность одним запросом
+        with self.assertNumQueries(4):
+            client.get(url)
+        with self.assertNumQueries(3):
+            response = client.get(url)
+
+        self.assertEqual(
+            [item['id'] for item in response.json()['results']],
+            [self.adv.pk]
+        )
+
+        # Объявление и его отзывы; автор для проверки прав не загружается
+        with self.assertNumQueries(2):
+            response = client.patch(
+                reverse('market_app:ads-detail',
+                        kwargs={'pk': self.another_adv.pk}),
+                data={'price': '1'})
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_403_FORBIDDEN
+        )
+
+    def test_jwt_principal_invalidated(self):
+        """
+        Изменение пользователя сбрасывает закэшированный Principal.
+        """
+
+        client = APIClient()
+        token = RefreshToken.for_user(self.another_user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        url = reverse('market_app:ads-detail', kwargs={'pk': self.adv.pk})
+
+        self.assertEqual(
+            client.patch(url, data={'price': '1'}).status_code,
+            status.HTTP_403_FORBIDDEN
+        )
+
+        self.another_user.role = User.ADMIN
+        self.another_user.save()
+        self.assertEqual(
+            client.patch(url, data={'price': '1'}).status_code,
+            status.HTTP_200_OK
+        )
+
+        self.another_user.is_active = False
+        self.another_user.save()
+        self.assertEqual(
+            client.get(url).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+
+    def test_adv_list_query_budget(self):
+        """
+        Список объявлений укладывается в бюджет запросов без повторов
+        при любом числе объявлений с отзывами.
+        """
+
+        for i in range(6):
+            adv = Advertisement.objects.create(
+                author=self.another_user,
+                title=f"budget {i}",
+                price="100",
+                description="budget adv"
+            )
+            Review.objects.create(author=self.user, ad=adv, text=f"r {i}")
+
+        with self.assertEndpointQueries('AdvertisementViewSet.list') as log:
+            response = self.client.get(reverse('market_app:ads-list'))
+
+        self.assertEqual(
+            response['X-Query-Count'],
+            str(log['AdvertisementViewSet.list'][0].count)
+        )
+
+    def test_query_budget_exceeded(self):
+        """
+        Превышение бюджета роняет тест, а при DEBUG пишется в лог.
+        """
+
+        budgets = {'AdvertisementViewSet.list': 1}
+        url = reverse('market_app:ads-list')
+        with self.settings(QUERY_BUDGETS=budgets):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(url)
+
+        with self.settings(QUERY_BUDGETS=budgets, QUERY_BUDGET_RAISE=False,
+                           DEBUG=True), \
+                self.assertLogs('market_app.querybudget', 'WARNING') as logs:
+            response = self.client.get(url + '?page=1')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertIn('AdvertisementViewSet.list', logs.output[0])
+
+    def test_metrics_endpoint(self):
+        """
+        /metrics отдаёт время ответа, запросы к базе, обращения к кэшу
+        и время сериализации в формате Prometheus.
+        """
+
+        self.client.get(reverse('market_app:ads-list'))
+        self.client.get(reverse('market_app:ads-list'))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        body = response.content.decode()
+        for line in (
+            'http_request_duration_seconds_count{endpoint="'
+            'AdvertisementViewSet.list",method="GET",status="200"}',
+            'db_queries_per_request_bucket{endpoint="'
+            'AdvertisementViewSet.list",le="3.0"}',
+            'cache_requests_total{cache="response",result="hit"}',
+            'serializer_duration_seconds_count{serializer='
+            '"AdvertisementSerializer"}',
+            'http_requests_in_flight',
+        ):
+            self.assertIn(line, body)
+
+    def test_metrics_endpoint_restricted(self):
+        """
+        /metrics закрыт для адресов вне METRICS_ALLOWED_NETWORKS, кроме
+        администраторов.
+        """
+
+        url = reverse('metrics')
+        with self.settings(METRICS_ALLOWED_NETWORKS=['10.0.0.0/8']):
+            self.assertEqual(
+                self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code,
+                status.HTTP_200_OK
+            )
+            self.assertEqual(
+                self.client.get(url, REMOTE_ADDR='192.0.2.1').status_code,
+                status.HTTP_403_FORBIDDEN
+            )
+
+            self.client.force_login(self.user)
+            self.assertEqual(
+                self.client.get(url, REMOTE_ADDR='192.0.2.1').status_code,
+                status.HTTP_403_FORBIDDEN
+            )
+            User.objects.filter(pk=self.user.pk).update(role='admin')
+            self.assertEqual(
+                self.client.get(url, REMOTE_ADDR='192.0.2.1').status_code,
+                status.HTTP_200_OK
+            )
+
+    def test_seed_market_command(self):
+        """
+        Генератор данных воспроизводим по seed и согласует счётчики отзывов.
+        """
+
+        def seed():
+            call_command('seed_market', '--users', '5', '--ads', '20',
+                         '--reviews', '200', '--batch-size', '7',
+                         '--seed', '1', stdout=StringIO())
+            ads = Advertisement.objects.filter(
+                author__email__endswith='@seed.example').order_by('pk')
+            return list(ads.values_list('title', 'price', 'review_count'))
+
+        first = seed()
+        self.assertEqual(
+            len(first),
+            20
+        )
+        self.assertEqual(
+            sum(count for _, _, count in first),
+            200
+        )
+        for adv in Advertisement.objects.filter(review_count__gt=0):
+            self.assertEqual(
+                adv.review_count,
+                adv.review_set.count()
+            )
+        # Распределение по Ципфу: самое популярное объявление заметно
+        # обгоняет среднее
+        self.assertGreater(max(count for _, _, count in first), 30)
+
+        Advertisement.objects.filter(
+            author__email__endswith='@seed.example').delete()
+        self.assertEqual(
+            seed(),
+            first
+        )
+
+    def test_benchmark_summary_and_baseline(self):
+        """
+        Сводка нагрузочного прогона и сравнение с baseline.
+        """
+
+        class Transport:
+            def request(self, scenario, path):
+                return (500 if path.endswith('9') else 200), '3'
+
+            def close(self):
+                pass
+
+        scenario = benchmark.Scenario('ads-list',
+                                      [f'/p{i}' for i in range(10)])
+        summary = benchmark.run_scenario(Transport(), scenario, total=100,
+                                         concurrency=3, warmup=5)
+
+        self.assertEqual(
+            (summary['requests'], summary['errors'], summary['queries_max']),
+            (100, 10, 3)
+        )
+        self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+        baseline = {'scenarios': {'ads-list': dict(summary, p95_ms=1,
+                                                   queries_max=2)}}
+        results = {'scenarios': {'ads-list': dict(summary, p95_ms=2)}}
+        self.assertEqual(
+            benchmark.compare(results, baseline, tolerance=0.5),
+            ['ads-list: p95_ms 1 -> 2', 'ads-list: queries_max 2 -> 3']
+        )
+
+    def test_benchmark_percentile_and_empty_run(self):
+        """
+        Перцентиль по ближайшему рангу без сдвига при целом
+        fraction * n, пустой прогон не падает.
+        """
+
+        self.assertEqual(benchmark.percentile([1, 2, 3], 0.5), 2)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(benchmark.percentile(list(range(1, 21)), 0.95), 19)
+        self.assertEqual(benchmark.percentile([1, 2], 0), 1)
+        self.assertEqual(benchmark.percentile([1, 2], 1), 2)
+
+        class Transport:
+            def request(self, scenario, path):
+                return 200, None
+
+            def close(self):
+                pass
+
+        summary = benchmark.run_scenario(
+            Transport(), benchmark.Scenario('empty', ['/']), total=0,
+            concurrency=2, warmup=0)
+        self.assertEqual(
+            (summary['requests'], summary['mean_ms'], summary['p95_ms']),
+            (0, None, None)
+        )
+
+    def test_explain_endpoints_suggests_index(self):
+        """
+        Анализ планов запросов предлагает индекс для выборки
+        объявлений автора с сортировкой по дате.
+        """
+        # Удаление откатится вместе с транзакцией теста
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX market_adv_author_created_idx')
+        out = StringIO()
+        # Запросы анализируются на основной базе и при настроенной реплике
+        with self.settings(REPLICA_DATABASE='replica'):
+            call_command('explain_endpoints', '--email', self.user.email,
+                         '--route', 'my_ads', '--min-rows', '0',
+                         stdout=out)
+
+        self.assertIn('GET /market/advs/me/ -> 200', out.getvalue())
+        self.assertIn(
+            'CREATE INDEX ON market_app_advertisement '
+            '(author_id, created_at DESC, id DESC);',
+            out.getvalue()
+        )
+
+    def test_replica_routing(self):
+        """
+        Чтения идут в реплику, после записи клиент читает свои изменения
+        из основной базы, при недоступной реплике — тоже из основной.
+        """
+        url = reverse('market_app:ads-list')
+        # Реплика в тестах — отдельное соединение с той же базой: данные
+        # незавершённой транзакции теста ей не видны, как при отставании
+
+        with self.settings(REPLICA_DATABASE='replica',
+                           REPLICA_RETRY_SECONDS=0):
+            self.assertEqual(
+                self.client.get(url).data['count'],
+                0
+            )
+
+            response = self.client.post(url, {
+                'title': 'new', 'price': 100, 'description': 'new adv'})
+            self.assertIn('read_primary_until', response.cookies)
+            self.assertEqual(
+                self.client.get(url).data['count'],
+                3
+            )
+
+            self.client.cookies.clear()
+            with mock.patch.object(connections['replica'],
+                                   'ensure_connection',
+                                   side_effect=OperationalError), \
+                    self.assertLogs('market_app.replicas', 'WARNING'):
+                self.assertEqual(
+                    self.client.get(url).data['count'],
+                    3
+                )
+
+    def test_replica_routing_response_cache(self):
+        """
+        Кэш ответов не сохраняет прочитанное из реплики, а клиент после
+        записи читает из основной базы мимо кэша.
+        """
+        url = reverse('market_app:ads-list')
+
+        with self.settings(REPLICA_DATABASE='replica',
+                           REPLICA_RETRY_SECONDS=0):
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertEqual(
+                    (response.data['count'], response['X-Cache']),
+                    (0, 'MISS')
+                )
+
+            self.client.post(url, {
+                'title': 'new', 'price': 100, 'description': 'new adv'})
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertEqual(
+                    (response.data['count'], response['X-Cache']),
+                    (3, 'BYPASS')
+                )
+
+            self.client.cookies.clear()
+            with mock.patch.object(connections['replica'],
+                                   'ensure_connection',
+                                   side_effect=OperationalError), \
+                    self.assertLogs('market_app.replicas', 'WARNING'):
+                response = self.client.get(url)
+            self.assertEqual(
+                (response.data['count'], response['X-Cache']),
+                (3, 'MISS')
+            )
+            response = self.client.get(url)
+            self.assertEqual(
+                (response.data['count'], response['X-Cache']),
+                (3, 'HIT')
+            )
+
+    def test_middleware_async_path(self):
+        """
+        Под ASGI собственные middleware работают без sync_to_async:
+        запросы к базе считаются так же, как под WSGI, а чтения
+        асинхронного представления идут в реплику.
+        """
+
+        async def get_response(request):
+            return HttpResponse()
+
+        for middleware in (MetricsMiddleware, QueryBudgetMiddleware,
+                           ReplicaMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(get_response)))
+
+        url = reverse('market_app:async-ads-list')
+
+        async def get():
+            return await self.async_client.get(url)
+
+        sync_response = self.client.get(url)
+        response = async_to_sync(get)()
+        self.assertEqual(
+            response['X-Query-Count'],
+            sync_response['X-Query-Count']
+        )
+
+        # Реплика не видит данных незавершённой транзакции теста
+        with self.settings(REPLICA_DATABASE='replica',
+                           RESPONSE_CACHE_TIMEOUT=0):
+            response = async_to_sync(get)()
+        self.assertEqual(
+            response.json()['count'],
+            0
+        )
+
+    def test_adv_list_filters_and_ordering(self):
+        """
+        Фильтры списка объявлений и сортировка по разрешённым полям.
+        """
+        url = reverse('market_app:ads-list')
+        Advertisement.objects.filter(pk=self.another_adv.pk).update(
+            image='images/test.jpg', review_count=5)
+
+        def titles(**params):
+            response = self.client.get(url, params)
+            return [item['title'] for item in response.data['results']]
+
+        self.assertEqual(
+            titles(price_min=1000, price_max=5000),
+            ['test 2']
+        )
+        self.assertEqual(
+            titles(author=self.user.pk),
+            ['test']
+        )
+        self.assertEqual(
+            titles(has_image='true'),
+            ['test 2']
+        )
+        self.assertEqual(
+            titles(has_image='false'),
+            ['test']
+        )
+        self.assertEqual(
+            titles(created_after=(now() + timedelta(days=1)).isoformat()),
+            []
+        )
+        self.assertEqual(
+            titles(ordering='price'),
+            ['test', 'test 2']
+        )
+        self.assertEqual(
+            titles(ordering='-review_count'),
+            ['test 2', 'test']
+        )
+        # Неразрешённое поле игнорируется
+        self.assertEqual(
+            titles(ordering='description'),
+            ['test 2', 'test']
+        )
+
+        response = self.client.get(url, {'ordering': 'price',
+                                         'pagination': 'cursor'})
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_adv_facets(self):
+        """
+        Счётчики по цене и возрасту считаются одним запросом с теми же
+        фильтрами, что у списка, и кэшируются по набору фильтров.
+        """
+        url = reverse('market_app:ads-facets')
+        Advertisement.objects.filter(pk=self.another_adv.pk).update(
+            created_at=now() - timedelta(days=10))
+
+        with self.assertEndpointQueries('AdvertisementViewSet.facets', 1):
+            response = self.client.get(url)
+
+        self.assertEqual(
+            response.data['total'],
+            2
+        )
+        self.assertEqual(
+            [bucket['count'] for bucket in response.data['price']],
+            [1, 1, 0, 0, 0]
+        )
+        self.assertEqual(
+            [bucket['count'] for bucket in response.data['created_at']],
+            [1, 1, 2, 2]
+        )
+
+        response = self.client.get(url, {'author': self.user.pk})
+        self.assertEqual(
+            response.data['total'],
+            1
+        )
+
+        # Тот же набор фильтров в другом порядке и с лишними параметрами
+        with self.assertEndpointQueries('AdvertisementViewSet.facets',
+                                        0):
+            response = self.client.get(
+                f'{url}?page=2&ordering=price&author={self.user.pk}')
+        self.assertEqual(
+            response.data['total'],
+            1
+        )
+
+    def test_adv_reviews_endpoint(self):
+        """
+        Объявление содержит только последние отзывы, а все отзывы
+        отдаются постранично через ads/{id}/reviews/.
+        """
+        Review.objects.bulk_create(
+            Review(author=self.another_user, ad=self.adv, text=f'review {i}',
+                   created_at=now() + timedelta(minutes=i))
+            for i in range(1, 15))
+
+        response = self.client.get(
+            reverse('market_app:ads-detail', kwargs={'pk': self.adv.pk}))
+        self.assertEqual(
+            response.data['review'],
+            ['review 14', 'review 13', 'review 12']
+        )
+
+        url = reverse('market_app:ads-reviews', kwargs={'pk': self.adv.pk})
+        texts = []
+        with self.assertEndpointQueries('AdvertisementViewSet.reviews'):
+            while url:
+                response = self.client.get(url)
+                texts.extend(item['text'] for item in response.data['results'])
+                url = response.data['next']
+
+        self.assertEqual(
+            texts,
+            [f'review {i}' for i in range(14, 0, -1)] + ['test review']
+        )
+
+        response = self.client.get(
+            reverse('market_app:ads-reviews', kwargs={'pk': 10 ** 6}))
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_sparse_fieldsets(self):
+        """
+        ?fields= и ?omit= сужают ответ и загружаемые столбцы, а без
+        поля отзывов они не подгружаются вовсе.
+        """
+        url = reverse('market_app:ads-list')
+
+        # COUNT для пагинации и объявления, без prefetch отзывов
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'title,price'})
+        self.assertEqual(
+            len(queries),
+            2
+        )
+        self.assertNotIn('"description"', queries[-1]['sql'])
+        self.assertEqual(
+            response.data['results'][0],
+            {'id': self.another_adv.pk, 'title': 'test 2',
+             'price': '3000.00'}
+        )
+
+        response = self.client.get(url, {'omit': 'description,image'})
+        self.assertEqual(
+            [(item['review'], 'description' in item)
+             for item in response.data['results']],
+            [('Nobody wants to comment it!', False),
+             (['test review'], False)]
+        )
+
+        response = self.client.get(
+            reverse('market_app:ads-reviews', kwargs={'pk': self.adv.pk}),
+            {'fields': 'text,unknown'})
+        self.assertEqual(
+            response.data['results'],
+            [{'id': self.review.pk, 'text': 'test review'}]
+        )
+
+        # Запросы на изменение не ограничиваются
+        response = self.client.patch(
+            reverse('market_app:ads-detail', kwargs={'pk': self.adv.pk})
+            + '?fields=title', {'price': 500})
+        self.assertEqual(
+            response.data['price'],
+            '500.00'
+        )
+
+    def test_fast_list_matches_serializer(self):
+        """
+        Быстрый список из .values() побайтно совпадает со списком
+        через AdvertisementSerializer при любых параметрах.
+        """
+        Advertisement.objects.filter(pk=self.another_adv.pk).update(
+            image='images/test.jpg', price='12.5',
+            description='Линия\u2028 "кавычки" \\ и\tтаб',
+            image_variants={'jpeg': {'320': 'images/a-320.jpg',
+                                     '160': 'images/a-160.jpg'},
+                            'webp': {'160': 'images/a-160.webp'}})
+        for i in range(5):
+            Review.objects.create(author=self.user, ad=self.another_adv,
+                                  text=f'отзыв {i}')
+            Advertisement.objects.create(author=self.user, title=f'ad {i}',
+                                         price=i, description='')
+
+        cases = [
+            (reverse('market_app:ads-list'), {}),
+            (reverse('market_app:ads-list'), {'page': 2}),
+            (reverse('market_app:ads-list'), {'pagination': 'cursor'}),
+            (reverse('market_app:ads-list'), {'search': 'test'}),
+            (reverse('market_app:ads-list'), {'ordering': '-price',
+                                              'fields': 'title,price,image'}),
+            (reverse('market_app:ads-list'), {'omit': 'review'}),
+            (reverse('market_app:my_ads'), {}),
+        ]
+        with self.settings(RESPONSE_CACHE_TIMEOUT=0):
+            for url, params in cases:
+                fast = self.client.get(url, params)
+                with mock.patch.object(AdvertisementViewSet, 'fast_list',
+                                       False), \
+                        mock.patch.object(AdsListAPIView, 'fast_list',
+                                          False):
+                    slow = self.client.get(url, params)
+                self.assertEqual(fast.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    fast.content,
+                    slow.content,
+                    (url, params)
+                )
+
+    def test_fast_renderers(self):
+        """
+        FastJSONRenderer выводит те же байты, что JSONRenderer,
+        MessagePack выбирается по заголовку Accept.
+        """
+        data = {'text': 'строка\u2028\u2029 "x" \\ \x01', 'none': None,
+                'price': Decimal('1.50'), 'when': now(), 'day': now().date(),
+                'lazy': gettext_lazy('Объявление'),
+                'nested': [{1: True}, 1.5]}
+        # Целое длиннее 64 бит и числа в экспоненциальной записи выводит
+        # стандартный JSONRenderer
+        for value in (data, dict(data, big=2 ** 70), {'a': 1e16},
+                      {'a': [0.0, -2.5e-5, 9999999999999998.0]}):
+            self.assertEqual(
+                FastJSONRenderer().render(value),
+                JSONRenderer().render(value)
+            )
+        for value in (float('inf'), float('nan'), -float('inf')):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({'nested': [{'a': value}]})
+
+        response = self.client.get(reverse('market_app:ads-list'),
+                                   HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(
+            response['Content-Type'],
+            'application/msgpack'
+        )
+        self.assertEqual(
+            msgpack.unpackb(response.content),
+            json.loads(self.client.get(reverse('market_app:ads-list'),
+                                       HTTP_ACCEPT='application/json'
+                                       ).content)
+        )
+        packed = MessagePackRenderer().render({'price': Decimal('1.50')})
+        self.assertEqual(
+            msgpack.unpackb(packed),
+            {'price': 1.5}
+        )
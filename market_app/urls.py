@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from market_app.apps import MarketAppConfig
+from market_app.async_views import AsyncAdvertisementView, AsyncReviewView
 from market_app.views import (AdsListAPIView, AdvertisementViewSet,
                               ReviewViewSet)
 
@@ -13,5 +14,13 @@ router.register(r'reviews', ReviewViewSet, basename='reviews')
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('advs/me/', AdsListAPIView.as_view(), name='my_ads')
+    path('advs/me/', AdsListAPIView.as_view(), name='my_ads'),
+    path('async/ads/', AsyncAdvertisementView.as_view(),
+         name='async-ads-list'),
+    path('async/ads/<int:pk>/', AsyncAdvertisementView.as_view(),
+         name='async-ads-detail'),
+    path('async/reviews/', AsyncReviewView.as_view(),
+         name='async-reviews-list'),
+    path('async/reviews/<int:pk>/', AsyncReviewView.as_view(),
+         name='async-reviews-detail'),
 ]
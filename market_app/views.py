@@ -1,21 +1,58 @@
-from rest_framework import viewsets, generics
-from rest_framework.filters import SearchFilter
+import hashlib
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status, viewsets, generics
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
 
+from market_app.cache import (ConditionalGetMixin, ResponseCacheMixin,
+                              invalidate_responses)
+from market_app.export import (ADVERTISEMENT_FIELDS, REVIEW_FIELDS,
+                               ExportMixin)
+from market_app.facets import FacetsMixin
+from market_app.fastpath import FastListMixin
+from market_app.filters import (AdvertisementFilterSet,
+                                AdvertisementOrderingFilter,
+                                AdvertisementSearchFilter)
+from market_app.metrics import observe_cache
 from market_app.models import Advertisement, Review
-from market_app.paginators import AdvertisementPaginator, ReviewPaginator
+from market_app.paginators import (AdvertisementPaginator,
+                                   ReviewCursorPaginator, ReviewPaginator)
 from market_app.permissions import IsAuthorOrAdmin
-from market_app.serializers import (AdvertisementSerializer,
+from market_app.serializers import (AdvertisementBulkSerializer,
+                                    AdvertisementSerializer,
                                     ReviewSerializer)
+from market_app.sparse import SparseQuerysetMixin
+from users_app.authentication import PrincipalJWTAuthentication
 
 
-class AdvertisementViewSet(viewsets.ModelViewSet):
+class AdvertisementViewSet(SparseQuerysetMixin, ConditionalGetMixin,
+                           ResponseCacheMixin, ExportMixin, FacetsMixin,
+                           FastListMixin, viewsets.ModelViewSet):
     serializer_class = AdvertisementSerializer
-    queryset = Advertisement.objects.all()
+    queryset = Advertisement.objects.with_reviews()
+    authentication_classes = [PrincipalJWTAuthentication]
     pagination_class = AdvertisementPaginator
-    filter_backends = [SearchFilter]
-    search_fields = ['title']
+    filter_backends = [DjangoFilterBackend, AdvertisementSearchFilter,
+                       AdvertisementOrderingFilter]
+    filterset_class = AdvertisementFilterSet
+    lookup_value_regex = r'\d+'
+    facets_search_filter = AdvertisementSearchFilter
+    suggest_min_length = 2
+    suggest_limit = 10
+    suggest_max_limit = 20
+    bulk_max_items = 100
+    export_fields = ADVERTISEMENT_FIELDS
     permission_classes_by_action = {'list': [AllowAny],
+                                    'suggest': [AllowAny],
+                                    'facets': [AllowAny],
+                                    'reviews': [AllowAny],
                                     'partial_update': [IsAuthorOrAdmin],
                                     'update': [IsAuthorOrAdmin],
                                     'destroy': [IsAuthorOrAdmin],
@@ -28,26 +65,200 @@ class AdvertisementViewSet(viewsets.ModelViewSet):
                 ]
 
     def perform_create(self, serializer):
-        adv = serializer.save(author=self.request.user)
-        adv.save()
+        serializer.save(author_id=self.request.user.pk)
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """
+        Подсказки заголовков для автодополнения: ?q=<начало запроса>.
+        Ответы кэшируются по нормализованному запросу.
+        """
+        query = ' '.join(request.query_params.get('q', '').lower().split())
+        query = query[:Advertisement._meta.get_field('title').max_length]
+        try:
+            limit = min(int(request.query_params.get('limit',
+                                                     self.suggest_limit)),
+                        self.suggest_max_limit)
+        except ValueError:
+            limit = self.suggest_limit
+
+        if len(query) < self.suggest_min_length or limit < 1:
+            return Response({'results': []})
+
+        cache = caches['suggest']
+        key = 'suggest:{}:{}'.format(
+            limit, hashlib.md5(query.encode()).hexdigest())
+        titles = cache.get(key)
+        observe_cache('suggest', titles is not None)
+        if titles is None:
+            titles = Advertisement.objects.suggest_titles(query, limit)
+            cache.set(key, titles)
+        return Response({'results': titles})
+
+    @action(detail=True, methods=['get'])
+    def reviews(self, request, pk=None):
+        """
+        Все отзывы объявления с курсорной пагинацией: страница выбирается
+        по индексу (ad_id, -created_at, -id) без COUNT(*) и OFFSET.
+        """
+        return self.cached_response(self.list_reviews, request, pk=pk)
+
+    def list_reviews(self, request, pk):
+        paginator = ReviewCursorPaginator()
+        queryset = ReviewSerializer.sparse_queryset(
+            Review.objects.filter(ad_id=pk), request)
+        page = paginator.paginate_queryset(queryset, request, self)
+        # Пустая страница — повод проверить, есть ли само объявление
+        if not page and not Advertisement.objects.filter(pk=pk).exists():
+            raise NotFound()
+        serializer = ReviewSerializer(page, many=True,
+                                      context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        """
+        Пакетные операции: POST — список новых объявлений, PATCH — список
+        изменений с id, DELETE — {"ids": [...]}. Всё выполняется в одной
+        транзакции, ответ содержит результат для каждого элемента.
+        """
+        handler = {'POST': self.bulk_create,
+                   'PATCH': self.bulk_update,
+                   'DELETE': self.bulk_destroy}[request.method]
+        with transaction.atomic():
+            results = handler(request)
+        invalidate_responses()
+        return Response({'results': results})
+
+    def get_bulk_items(self, items):
+        if not isinstance(items, list):
+            raise ValidationError('Expected a list of items.')
+        if len(items) > self.bulk_max_items:
+            raise ValidationError(
+                f'No more than {self.bulk_max_items} items per request.')
+        return items
+
+    def bulk_create(self, request):
+        results, ads = [], []
+        for index, item in enumerate(self.get_bulk_items(request.data)):
+            serializer = AdvertisementBulkSerializer(data=item)
+            if serializer.is_valid():
+                ads.append(Advertisement(author_id=request.user.pk,
+                                         **serializer.validated_data))
+                results.append({'index': index,
+                                'status': status.HTTP_201_CREATED})
+            else:
+                results.append({'index': index,
+                                'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': serializer.errors})
+
+        created = iter(Advertisement.objects.bulk_create(ads))
+        for result in results:
+            if result['status'] == status.HTTP_201_CREATED:
+                result['id'] = next(created).pk
+        return results
+
+    def bulk_update(self, request):
+        items = self.get_bulk_items(request.data)
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        ids = [pk for pk in ids if isinstance(pk, int)]
+        # Повторы одного id изменяли бы один объект несколько раз,
+        # поэтому отклоняются все элементы с таким id
+        repeated = {pk for pk, count in Counter(ids).items() if count > 1}
+        existing = set(Advertisement.objects.filter(
+            pk__in=ids).values_list('pk', flat=True))
+        allowed = IsAuthorOrAdmin().filter_queryset(
+            request, Advertisement.objects.filter(pk__in=existing)
+        ).select_for_update().in_bulk()
+
+        results, ads, fields = [], [], {'updated_at'}
+        now = timezone.now()
+        for item in items:
+            pk = item.get('id') if isinstance(item, dict) else None
+            if not isinstance(pk, int):
+                results.append({'id': pk,
+                                'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': {'id': ['This field is required.']}})
+                continue
+            if pk in repeated:
+                results.append({'id': pk,
+                                'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': {'id': ['Duplicate id.']}})
+                continue
+            if pk not in existing:
+                results.append({'id': pk, 'status': status.HTTP_404_NOT_FOUND})
+                continue
+            if pk not in allowed:
+                results.append({'id': pk, 'status': status.HTTP_403_FORBIDDEN})
+                continue
+
+            serializer = AdvertisementBulkSerializer(
+                allowed[pk], data=item, partial=True)
+            if not serializer.is_valid():
+                results.append({'id': pk,
+                                'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': serializer.errors})
+                continue
+            ad = allowed[pk]
+            for field, value in serializer.validated_data.items():
+                setattr(ad, field, value)
+                fields.add(field)
+            ad.updated_at = now
+            ads.append(ad)
+            results.append({'id': pk, 'status': status.HTTP_200_OK})
+
+        Advertisement.objects.bulk_update(ads, sorted(fields))
+        return results
+
+    def bulk_destroy(self, request):
+        data = request.data if isinstance(request.data, dict) else {}
+        ids = self.get_bulk_items(data.get('ids'))
+        queryset = Advertisement.objects.filter(
+            pk__in=[pk for pk in ids if isinstance(pk, int)])
+        existing = set(queryset.values_list('pk', flat=True))
+        allowed = IsAuthorOrAdmin().filter_queryset(request, queryset)
+        allowed_ids = set(allowed.values_list('pk', flat=True))
+
+        allowed.delete()
+        results = []
+        for pk in ids:
+            if not isinstance(pk, int):
+                code = status.HTTP_400_BAD_REQUEST
+            elif pk not in existing:
+                code = status.HTTP_404_NOT_FOUND
+            elif pk not in allowed_ids:
+                code = status.HTTP_403_FORBIDDEN
+            else:
+                code = status.HTTP_204_NO_CONTENT
+            results.append({'id': pk, 'status': code})
+        return results
 
 
-class AdsListAPIView(generics.ListAPIView):
+class AdsListAPIView(SparseQuerysetMixin, FastListMixin,
+                     generics.ListAPIView):
     serializer_class = AdvertisementSerializer
-    queryset = Advertisement.objects.all()
+    queryset = Advertisement.objects.with_reviews()
+    authentication_classes = [PrincipalJWTAuthentication]
     pagination_class = AdvertisementPaginator
-    filter_backends = [SearchFilter]
-    search_fields = ['title']
-    permission_classes = [IsAuthorOrAdmin]
+    filter_backends = [DjangoFilterBackend, AdvertisementSearchFilter,
+                       AdvertisementOrderingFilter]
+    filterset_class = AdvertisementFilterSet
+    # Без IsAuthenticated анонимный запрос получил бы объявления
+    # с author IS NULL
+    permission_classes = [IsAuthenticated, IsAuthorOrAdmin]
 
     def get_queryset(self):
-        return Advertisement.objects.filter(author=self.request.user)
+        return super().get_queryset().filter(
+            author_id=self.request.user.pk)
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseQuerysetMixin, ConditionalGetMixin,
+                    ResponseCacheMixin, ExportMixin, viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
     queryset = Review.objects.all()
+    authentication_classes = [PrincipalJWTAuthentication]
     pagination_class = ReviewPaginator
+    export_fields = REVIEW_FIELDS
     permission_classes_by_action = {'list': [AllowAny],
                                     'partial_update': [IsAuthorOrAdmin],
                                     'update': [IsAuthorOrAdmin],
@@ -61,5 +272,4 @@ class ReviewViewSet(viewsets.ModelViewSet):
                 ]
 
     def perform_create(self, serializer):
-        review = serializer.save(author=self.request.user)
-        review.save()
+        serializer.save(author_id=self.request.user.pk)
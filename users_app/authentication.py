@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken)
+from rest_framework_simplejwt.settings import api_settings
+
+
+PRINCIPAL_KEY = 'users:principal:{}'
+
+
+class Principal:
+    """
+    Аутентифицированный пользователь без строки из базы: id из токена,
+    роль и активность из кэша. Для проверок прав этого достаточно,
+    а связи с пользователем задаются через author_id.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, pk, role, is_active):
+        self.pk = self.id = pk
+        self.role = role
+        self.is_active = is_active
+
+    def __eq__(self, other):
+        return (isinstance(other, (Principal, get_user_model()))
+                and self.pk == other.pk)
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f'Principal {self.pk}'
+
+    @property
+    def is_admin(self):
+        return self.role == get_user_model().ADMIN
+
+    @property
+    def is_superuser(self):
+        return self.is_admin
+
+    @property
+    def is_staff(self):
+        return self.is_admin
+
+
+def get_cache():
+    return caches[settings.PRINCIPAL_CACHE_ALIAS]
+
+
+def _principal(user_id, values):
+    if values is None:
+        return None
+    return Principal(user_id, *values)
+
+
+def _fields_queryset(user_id):
+    return get_user_model().objects.filter(
+        **{api_settings.USER_ID_FIELD: user_id}
+    ).values_list('role', 'is_active')
+
+
+def get_principal(user_id):
+    """
+    Principal по id из токена. База читается только при промахе кэша.
+    """
+    key = PRINCIPAL_KEY.format(user_id)
+    values = get_cache().get(key)
+    if values is None:
+        values = _fields_queryset(user_id).first()
+        if values is not None:
+            get_cache().set(key, values, settings.PRINCIPAL_CACHE_TIMEOUT)
+    return _principal(user_id, values)
+
+
+async def aget_principal(user_id):
+    key = PRINCIPAL_KEY.format(user_id)
+    values = await get_cache().aget(key)
+    if values is None:
+        values = await _fields_queryset(user_id).afirst()
+        if values is not None:
+            await get_cache().aset(key, values,
+                                   settings.PRINCIPAL_CACHE_TIMEOUT)
+    return _principal(user_id, values)
+
+
+def invalidate_principal(user_id):
+    get_cache().delete(PRINCIPAL_KEY.format(user_id))
+
+
+def get_token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(
+            _('Token contained no recognizable user identification'))
+
+
+def check_principal(principal):
+    if principal is None:
+        raise AuthenticationFailed(_('User not found'),
+                                   code='user_not_found')
+    if not principal.is_active:
+        raise AuthenticationFailed(_('User is inactive'),
+                                   code='user_inactive')
+    return principal
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация, которая не загружает пользователя из базы:
+    request.user — Principal из кэша (см. get_principal). Изменения
+    пользователя сбрасывают кэш сигналами; если PRINCIPAL_CACHE_ALIAS
+    не общий для процессов, в остальных процессах запись устаревает
+    через PRINCIPAL_CACHE_TIMEOUT.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Проверка отзыва токена сравнивает хэш пароля из базы
+            return super().get_user(validated_token)
+        return check_principal(
+            get_principal(get_token_user_id(validated_token)))
@@ -65,6 +65,8 @@ class User(AbstractUser):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES,
                             default='user')
     image = models.ImageField(_("avatar"), **NULLABLE, upload_to='media/')
+    image_variants = models.JSONField(_("image variants"), default=dict,
+                                      editable=False)
 
     USERNAME_FIELD = 'email'
     # Поля, которые будут вызываться при создании
@@ -77,6 +79,13 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имя загруженного аватара, чтобы отпустить ссылку при замене
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
     @property
     def is_admin(self):
         return self.role == 'admin'
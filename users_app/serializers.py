@@ -0,0 +1,10 @@
+from djoser.serializers import UserSerializer as BaseUserSerializer
+
+from market_app.images import ImageVariantsField
+
+
+class UserSerializer(BaseUserSerializer):
+    image_variants = ImageVariantsField()
+
+    class Meta(BaseUserSerializer.Meta):
+        fields = BaseUserSerializer.Meta.fields + ('image_variants',)
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users_app.authentication import invalidate_principal
+from users_app.models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Сброс сразу и после коммита: запрос, прочитавший старые данные
+    # до коммита, не должен оставить их в кэше
+    invalidate_principal(instance.pk)
+    transaction.on_commit(lambda: invalidate_principal(instance.pk))
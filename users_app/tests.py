@@ -140,6 +140,7 @@ class UsersTestCase(APITestCase):
             'first_name': 'Ro',
             'id': 1,
             'image': None,
+            'image_variants': None,
             'last_name': 'Ta',
             'phone': None
             }
@@ -194,6 +195,7 @@ class UsersTestCase(APITestCase):
             'first_name': 'Ro',
             'id': 1,
             'image': None,
+            'image_variants': None,
             'last_name': 'T',
             'phone': None
             }